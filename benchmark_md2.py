@@ -0,0 +1,174 @@
+from sys import path, argv, exit, version
+from os import listdir
+from os.path import join, dirname, abspath, getsize
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import tracemalloc
+import json
+import numpy as np
+
+try: import bpy
+except ImportError: bpy = None
+
+if bpy is None:
+	import headless_atd # the bpy-free modules of the addon
+else:
+	path.insert(0, dirname(abspath(__file__))) # the whole addon, run as blender -b -P benchmark_md2.py -- <arguments>
+from io_atd.read_atd import MD2Reader, buildfaces
+from io_atd.parse_atd import parse
+from io_atd.pack_atd import packmdl2
+from generate_md2 import generatecorpus
+
+# Times each stage of reading and writing .md2 files over synthetic models of a few sizes, or a directory of real ones.
+# The Blender stages, building the objects and exporting them, only run inside Blender.
+# usage: benchmark_md2.py [--corpus directory] [--output results.json] [--baseline results.json] [--threshold fraction]
+
+SIZES = { # name: files, vertices per rendergroup, rendergroups
+	'small' : (50, 100, 2),
+	'medium': (10, 2000, 4),
+	'huge'  : (2, 30000, 8), # about as many faces as a rendergroup can count
+}
+
+def stage_header(filepaths):
+	for filepath in filepaths:
+		MD2Reader(filepath).close()
+
+def stage_vertices(filepaths):
+	for filepath in filepaths:
+		with MD2Reader(filepath) as reader:
+			for detaillevel, rendergroups in reader.detaillevels:
+				for rendergroup in rendergroups:
+					vertices = reader.readvertices(rendergroup)
+					np.ascontiguousarray(vertices['vector'][:, ::-1])
+					np.ascontiguousarray(vertices['normal'][:, ::-1])
+					vertices['texcoord'].copy()
+					del vertices
+
+def stage_indices(filepaths):
+	for filepath in filepaths:
+		with MD2Reader(filepath) as reader:
+			for detaillevel, rendergroups in reader.detaillevels:
+				for rendergroup in rendergroups:
+					buildfaces(rendergroup.fill_type, rendergroup.polygons, reader.readindices(rendergroup))
+
+def stage_pack(filepaths, models):
+	for model in models:
+		packmdl2(
+			(1.5, 1.5, 1.5), 5., 1, None, (0, 0, 0, 0),
+			[(bitmap.path, 0, index) for index, bitmap in enumerate(model.bitmaps)],
+			[],
+			[
+				(detaillevel.type, detaillevel.maxedgelength, [
+					(
+						(len(rendergroup.faces), len(rendergroup.positions), 1, 0, 1, 0, 1, 0, 1, 0, rendergroup.texture, 0, 3, *(0xFFFFFFFF, 0xFFFF, 0x0F, 0x03)*3,
+						0, 12, 0, 24, 32, 1, 0b1011, len(rendergroup.positions), 1, 0),
+						np.hstack((rendergroup.positions[:, ::-1], rendergroup.normals[:, ::-1], rendergroup.uvs[:, -1])),
+						0,
+						rendergroup.faces,
+					)
+					for rendergroup in detaillevel.rendergroups
+				])
+				for detaillevel in model.detaillevels
+			],
+		)
+
+def stage_build(filepaths):
+	from io_atd import import_atd
+	for filepath in filepaths:
+		import_atd.open_atd(filepath, usebitmaps = False, usetext = False)
+
+def stage_export(filepaths, directory):
+	from io_atd import export_atd
+	export_atd.write_atd(join(directory, 'export.md2'), version = 'MDL2')
+
+def measure(function, *args, repeat = 3, memory = True):
+	"""Best wall time of a few runs, and the peak of memory allocated by Python and NumPy during one more, or None without memory"""
+	seconds = min(timed(function, *args) for run in range(repeat))
+	if not memory: return seconds, None
+	tracemalloc.start()
+	function(*args)
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return seconds, peak
+
+def timed(function, *args):
+	start = perf_counter()
+	function(*args)
+	return perf_counter() - start
+
+def benchmark(name, filepaths, directory, repeat = 3):
+	"""Results of every stage over a set of files, as {stage: {measure: value}}"""
+	size = sum(getsize(filepath) for filepath in filepaths)
+	models = [parse(filepath) for filepath in filepaths]
+	vertices = sum(len(rendergroup.positions) for model in models for detaillevel in model.detaillevels for rendergroup in detaillevel.rendergroups)
+	faces    = sum(len(rendergroup.faces)     for model in models for detaillevel in model.detaillevels for rendergroup in detaillevel.rendergroups)
+	stages = [
+		('header'  , stage_header  , (filepaths,)),
+		('vertices', stage_vertices, (filepaths,)),
+		('indices' , stage_indices , (filepaths,)),
+		('pack'    , stage_pack    , (filepaths, models)),
+	]
+	if bpy is not None:
+		bpy.ops.wm.read_factory_settings(use_empty = True)
+		stages += [('build', stage_build, (filepaths,))]
+		stages += [('export', stage_export, (filepaths, directory))] # exports the whole scene the builds left behind
+	results = {}
+	for stage, function, args in stages:
+		blender = stage in ('build', 'export') # building again would add a copy of the corpus to the scene, and to what is exported
+		seconds, peak = measure(function, *args, repeat = 1 if blender else repeat, memory = not blender)
+		results['%s/%s' % (name, stage)] = {
+			'seconds'       : seconds,
+			'mb_per_s'      : size / seconds / 1e6,
+			'vertices_per_s': vertices / seconds,
+			'faces_per_s'   : faces / seconds,
+			'peak_mb'       : None if peak is None else peak / 1e6,
+			'files'         : len(filepaths),
+			'bytes'         : size,
+		}
+	return results
+
+def regressions(results, baseline, threshold, min_seconds = .01):
+	"""
+	Stages of the baseline that got slower by more than threshold, as (stage, seconds, baseline seconds).
+	A stage must also be min_seconds slower, as the timer noise of the shortest stages is larger than any threshold.
+	"""
+	return [
+		(stage, results[stage]['seconds'], before['seconds'])
+		for stage, before in baseline.items()
+		if stage in results and results[stage]['seconds'] > max(before['seconds'] * (1 + threshold), before['seconds'] + min_seconds)
+	]
+
+if __name__ == '__main__':
+	parser = ArgumentParser(description = 'Time the stages of reading and writing .md2 files.')
+	parser.add_argument('--corpus'     , help = 'directory of .md2 files to measure instead of the synthetic sizes')
+	parser.add_argument('--repeat'     , type = int, default = 3, help = 'runs of each stage, the fastest counts')
+	parser.add_argument('--output'     , help = 'file to write the results to as JSON')
+	parser.add_argument('--baseline'   , help = 'results of an earlier run to compare against')
+	parser.add_argument('--threshold'  , type = float, default = .25, help = 'slowdown over the baseline that fails the run, .25 by default')
+	parser.add_argument('--min-seconds', type = float, default = .01, help = 'seconds a stage must also slow down by to fail the run, .01 by default')
+	args = parser.parse_args(argv[argv.index('--') + 1:] if '--' in argv else argv[1:])
+
+	results = {}
+	with TemporaryDirectory() as directory:
+		if args.corpus:
+			filepaths = [join(args.corpus, name) for name in sorted(listdir(args.corpus)) if name.lower().endswith('.md2')]
+			results.update(benchmark('corpus', filepaths, directory, args.repeat))
+		else:
+			for name, (count, vertices, rendergroups) in SIZES.items():
+				corpus = join(directory, name)
+				generatecorpus(corpus, count, vertices = vertices, rendergroups = rendergroups)
+				results.update(benchmark(name, [join(corpus, filename) for filename in sorted(listdir(corpus))], directory, args.repeat))
+
+	print('%-16s %10s %10s %14s %10s' % ('stage', 'seconds', 'MB/s', 'vertices/s', 'peak MB'))
+	for stage, result in results.items():
+		print('%-16s %10.4f %10.1f %14.0f %10s' % (stage, result['seconds'], result['mb_per_s'], result['vertices_per_s'], '' if result['peak_mb'] is None else '%.1f' % result['peak_mb']))
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump({'python': version, 'numpy': np.__version__, 'blender': bpy is not None, 'results': results}, f, indent = '\t')
+	if args.baseline:
+		with open(args.baseline) as f: baseline = json.load(f)['results']
+		slower = regressions(results, baseline, args.threshold, args.min_seconds)
+		for stage, seconds, before in slower:
+			print('%s regressed: %.4f seconds instead of %.4f' % (stage, seconds, before))
+		exit(1 if slower else 0)
\ No newline at end of file
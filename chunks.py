@@ -1,28 +1,83 @@
-from sys import argv
-from struct import unpack
+from sys import stdout
 from os import walk
-from os.path import isdir, isfile, join, split, splitext
-
-if isfile(argv[1]):
-	f = open(argv[1], 'rb')
-	while 1:
-		cn = f.read(4)
-		if cn == b'\0\0\0\0' or len(cn) < 4: break
-		cl = unpack('I', f.read(4))[0]
-		print('%08x %s %08x' % (f.tell() - 8, cn.decode('utf8'), cl))
-		f.seek(cl, 1)
-else:
-	chunks = {}
-	for dir, dirs, files in walk(argv[1]):
+from os.path import isfile, join, dirname, abspath, relpath
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from struct import error as StructError
+import json, csv
+
+import headless_atd # the bpy-free modules of the addon
+from io_atd.read_atd import MD2Reader
+
+# Scans .md2 files for their chunk layout; a directory is scanned over a pool of processes.
+# usage: chunks.py <file or directory> [--format json|csv] [--stats] [--output file] [--jobs n]
+
+def findmd2(searchdir):
+	for dir, dirs, files in walk(searchdir):
 		for file in files:
-			if file.lower().endswith('.md2'):
-				f = open(join(dir, file), 'rb')
-				while 1:
-					cn = f.read(4)
-					if cn == b'MDL0' or cn == b'\0\0\0\0' or len(cn) < 4: break
-					cl = unpack('I', f.read(4))[0]
-					if not cn in chunks: chunks[cn] = 1
-					else: chunks[cn] += 1
-					f.seek(cl, 1)
-	for key in chunks: print(key, chunks[key])
-input('Done')
\ No newline at end of file
+			if file.lower().endswith('.md2'): yield join(dir, file)
+
+def scanfile(filepath):
+	"""[(chunk name, offset of the chunk, chunk size)], or an error string"""
+	try:
+		with MD2Reader(filepath) as reader:
+			return filepath, [(cn.decode('ascii', 'replace'), offset - 8, cl) for cn, offset, cl in reader.chunks], None
+	except (OSError, ValueError, StructError) as e:
+		return filepath, [], '%s: %s' % (type(e).__name__, e)
+
+def scan(filepaths, jobs = None):
+	if len(filepaths) < 2 or jobs == 1: return [scanfile(filepath) for filepath in filepaths]
+	with Pool(jobs) as pool:
+		return sorted(pool.imap_unordered(scanfile, filepaths, chunksize = 16))
+
+def chunkstats(results):
+	chunks = {}
+	for filepath, layout, error in results:
+		for cn, offset, cl in layout:
+			if not cn in chunks: chunks[cn] = {'count': 0, 'total': 0, 'min': cl, 'max': cl}
+			stats = chunks[cn]
+			stats['count'] += 1
+			stats['total'] += cl
+			stats['min'] = min(stats['min'], cl)
+			stats['max'] = max(stats['max'], cl)
+	return chunks
+
+def writejson(output, root, results):
+	json.dump({
+		'files': {
+			relpath(filepath, root): {'chunks': [{'name': cn, 'offset': offset, 'size': cl} for cn, offset, cl in layout], 'error': error}
+			for filepath, layout, error in results
+		},
+		'chunks': chunkstats(results),
+	}, output, indent = '\t')
+	output.write('\n')
+
+def writecsv(output, root, results, stats = False):
+	writer = csv.writer(output, lineterminator = '\n')
+	if stats:
+		writer.writerow(('name', 'count', 'total', 'min', 'max'))
+		for cn, chunk in sorted(chunkstats(results).items()):
+			writer.writerow((cn, chunk['count'], chunk['total'], chunk['min'], chunk['max']))
+	else:
+		writer.writerow(('file', 'name', 'offset', 'size', 'error'))
+		for filepath, layout, error in results:
+			if error: writer.writerow((relpath(filepath, root), '', '', '', error))
+			for cn, offset, cl in layout: writer.writerow((relpath(filepath, root), cn, offset, cl, ''))
+
+if __name__ == '__main__':
+	parser = ArgumentParser(description = 'Report the chunk layout of .md2 files.')
+	parser.add_argument('path', help = 'an .md2 file, or a directory to search for them')
+	parser.add_argument('--format', choices = ('json', 'csv'), default = 'json')
+	parser.add_argument('--stats' , action = 'store_true', help = 'csv: write per chunk statistics instead of the per file layout')
+	parser.add_argument('--output', help = 'file to write to instead of standard output')
+	parser.add_argument('--jobs'  , type = int, default = None, help = 'worker processes, defaults to the number of cores')
+	args = parser.parse_args()
+	
+	if isfile(args.path): root, filepaths = dirname(abspath(args.path)), [abspath(args.path)]
+	else: root, filepaths = args.path, list(findmd2(args.path))
+	results = scan(filepaths, args.jobs)
+	
+	output = open(args.output, 'w', newline = '') if args.output else stdout
+	if args.format == 'json': writejson(output, root, results)
+	else: writecsv(output, root, results, args.stats)
+	if args.output: output.close()
\ No newline at end of file
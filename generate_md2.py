@@ -0,0 +1,155 @@
+from os import makedirs
+from os.path import join
+from argparse import ArgumentParser
+import numpy as np
+
+import headless_atd # the bpy-free modules of the addon
+from io_atd.read_atd import VERTEX_HAS_VECTOR, VERTEX_HAS_NORMAL, VERTEX_HAS_COLOR, VERTEX_HAS_UV
+from io_atd.pack_atd import packmdl2, packmdl0, writeatomic
+
+# Synthetic .md2 files for benchmarking without the game's assets. Every file is a set of noisy grids,
+# and the rare traits listed in "LR2 rare fields.txt" are drawn at the rate they have among LR2's files.
+# usage: generate_md2.py <directory> [--count n] [--seed n] [--vertices n] [--rendergroups n] [--detaillevels n] [--strips fraction]
+
+LR2_FILES = 1022
+TRAITS = { # files of each group in LR2, see "LR2 rare fields.txt"
+	'mdl1'    : 4,
+	'mdl0'    : 14,
+	'flow'    : 17,
+	'colored' : 35,
+	'effects' : 54,
+	'distant' : 58,
+	'double'  : 26,
+	'rgeffect': 2,
+	'disorder': 108,
+}
+EFFECTMASKS = (3, 9, 17, 513)
+DEFAULT_TEXBLEND = (0xFFFFFFFF, 0xFFFF, 0x0F, 0x03)
+MATPROP_MDL2 = (*(0.3764,)*4, *(0.5019,)*4, *(0.6588,)*4, *(0,)*4, 0, 0, 0, 0, b'RRU')
+MATPROP_MDL1 = (0, 1., 1., 1., 1., 1., 1.)
+
+def drawtraits(rng):
+	traits = {trait for trait, files in TRAITS.items() if rng.random_sample() < files / LR2_FILES}
+	if 'mdl0' in traits: traits -= {'mdl1', 'distant', 'effects', 'rgeffect', 'flow'} # a single plain mesh
+	return traits
+
+def grid(rng, vertices):
+	"""Positions, normals, uvs and faces of a noisy square grid of about the given vertex count"""
+	side = max(int(vertices ** .5), 2)
+	u, v = np.meshgrid(np.linspace(0, 1, side, dtype = np.float32), np.linspace(0, 1, side, dtype = np.float32))
+	positions = np.column_stack((u.ravel() * 10, v.ravel() * 10, rng.standard_normal(side * side).astype(np.float32) * .1))
+	normals = np.tile(np.float32((0, 0, 1)), (side * side, 1))
+	uvs = np.column_stack((u.ravel(), v.ravel()))
+	corner = np.arange(side * side).reshape(side, side)[:-1, :-1].ravel()
+	faces = np.concatenate((
+		np.column_stack((corner, corner + 1, corner + side)),
+		np.column_stack((corner + 1, corner + side + 1, corner + side)),
+	))
+	return positions, normals, uvs, faces
+
+def stripgrid(side):
+	"""A grid of faces as one strip, row by row, joined by degenerate triangles"""
+	strip = []
+	for row in range(side - 1):
+		if strip: strip += [strip[-1], (row + 1) * side]
+		for column in range(side):
+			strip += [(row + 1) * side + column, row * side + column] # wound as the faces of grid
+	return np.array(strip, np.uint16)
+
+def rendergroup(rng, traits, vertices, texture, strips):
+	positions, normals, uvs, faces = grid(rng, vertices)
+	if 'double' in traits: # repeat some faces, some of them wound the other way
+		repeated = faces[rng.choice(len(faces), max(len(faces) // 20, 1), replace = False)]
+		repeated[::2] = repeated[::2, ::-1]
+		faces = np.concatenate((faces, repeated))
+	num_texcoords = 2 if 'flow' in traits else 1
+	colour = 'colored' in traits
+	columns = [positions[:, ::-1], normals[:, ::-1]] # file order is z, y, x
+	if colour: columns += [rng.random_sample((len(positions), 4)).astype(np.float32)]
+	columns += [uvs] * num_texcoords
+	vertexbuffer = np.hstack(columns).astype(np.float32)
+	offset_texcoord = 40 if colour else 24
+	fill_type, indices, polygons = 0, faces, len(faces)
+	if strips and 'double' not in traits:
+		side = int(len(positions) ** .5)
+		fill_type, indices = 1, stripgrid(side)
+		polygons = len(indices) - 2
+	effects = 'effects' in traits
+	header = (
+		polygons         , # polygons
+		len(positions)   , # vertices
+		1                , # material
+		512 if 'rgeffect' in traits else 0, # effects
+		EFFECTMASKS[rng.randint(len(EFFECTMASKS))] if effects else 0, # texblend effect mask
+		0                , # render reference
+		2 if effects else 1, # texblend effects
+		0                , # custom
+		num_texcoords    , # texblend coordinates
+		0, texture, 0, 3 , # effect, texture index, coordinate index, tiling info
+		*((1, texture, num_texcoords - 1, 3) if effects else DEFAULT_TEXBLEND),
+		*DEFAULT_TEXBLEND*2,
+		0                , # offset vector
+		12               , # offset normal
+		24 if colour else 0, # offset colour
+		offset_texcoord  , # offset texcoord
+		offset_texcoord + 8 * num_texcoords, # size of a vertex
+		num_texcoords    ,
+		VERTEX_HAS_VECTOR | VERTEX_HAS_NORMAL | VERTEX_HAS_UV | (VERTEX_HAS_COLOR if colour else 0),
+		len(positions)   , # vertices
+		1                , # managed buffer
+		0                , # current vertex
+	)
+	return header, vertexbuffer, fill_type, indices
+
+def generate(rng, traits, vertices = 1000, rendergroups = 4, detaillevels = 1, strips = False):
+	"""The bytes of a model with the given traits"""
+	bitmaps = ['game data\\synthetic\\texture%02i.tga' % x for x in range(rendergroups)]
+	if 'mdl0' in traits:
+		return packmdl0(bitmaps[:1], *rendergroup(rng, traits, vertices, 0, strips))
+	order = rng.permutation(len(bitmaps)) if 'disorder' in traits else range(len(bitmaps))
+	levels = detaillevels + ('distant' in traits and detaillevels < 2)
+	signature = b'MDL1' if 'mdl1' in traits else b'MDL2'
+	return packmdl2(
+		(1.5, 1.5, 1.5), # inertia multiplier
+		15.,             # bounding radius
+		1,               # distance fades
+		(0, 0, -1, 10, 10, 1, 5, 5, 0, 0.) if signature == b'MDL2' else None,
+		(0, 0, 0, 0),
+		[(bitmaps[index], 0, int(index)) for index in order], # a bitmap's index is not always its position in the list
+		[MATPROP_MDL2 if signature == b'MDL2' else MATPROP_MDL1]*3,
+		[
+			(
+				2 if level else 1, # 1 for the base mesh, 2 for a distant one
+				10. / (level + 1),
+				[rendergroup(rng, traits, max(vertices >> 2 * level, 4), texture, strips) for texture in range(rendergroups)],
+			)
+			for level in range(levels)
+		],
+		signature,
+	)
+
+def generatecorpus(directory, count, seed = 0, strips = 0., **kwargs):
+	"""Write count models into directory, and return their file names and traits"""
+	rng = np.random.RandomState(seed)
+	makedirs(directory, exist_ok = True)
+	files = []
+	for file_id in range(count):
+		traits = drawtraits(rng)
+		filename = '%05i_%s.md2' % (file_id, '-'.join(sorted(traits)) or 'plain')
+		writeatomic(join(directory, filename), generate(rng, traits, strips = rng.random_sample() < strips, **kwargs))
+		files += [(filename, sorted(traits))]
+	return files
+
+if __name__ == '__main__':
+	parser = ArgumentParser(description = 'Write a reproducible corpus of synthetic .md2 files.')
+	parser.add_argument('path', help = 'directory to write the models into')
+	parser.add_argument('--count'       , type = int  , default = 100 , help = 'models to write')
+	parser.add_argument('--seed'        , type = int  , default = 0   , help = 'the same seed writes the same files')
+	parser.add_argument('--vertices'    , type = int  , default = 1000, help = 'vertices per rendergroup of the first detail level, at most about 31000 as polygons are counted in 16 bits')
+	parser.add_argument('--rendergroups', type = int  , default = 4   , help = 'rendergroups per detail level')
+	parser.add_argument('--detaillevels', type = int  , default = 1   , help = 'detail levels, distant models get at least 2')
+	parser.add_argument('--strips'      , type = float, default = 0.  , help = 'fraction of the models written as triangle strips')
+	args = parser.parse_args()
+	files = generatecorpus(args.path, args.count, args.seed, vertices = args.vertices, rendergroups = args.rendergroups, detaillevels = args.detaillevels, strips = args.strips)
+	for trait in TRAITS:
+		print('%-8s %i' % (trait, sum(trait in traits for filename, traits in files)))
\ No newline at end of file
@@ -0,0 +1,8 @@
+from sys     import modules
+from types   import ModuleType
+from os.path import join, dirname, abspath
+
+# Imported by the command line tools before io_atd, to reach the bpy-free modules of the addon without its __init__, which needs Blender.
+
+io_atd = modules.setdefault('io_atd', ModuleType('io_atd'))
+io_atd.__path__ = [join(dirname(abspath(__file__)), 'io_atd')]
\ No newline at end of file
@@ -0,0 +1,193 @@
+from os import walk, stat
+from os.path import join, relpath
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from hashlib import sha1
+from struct import error as StructError
+import sqlite3
+
+import headless_atd # the bpy-free modules of the addon
+from io_atd.read_atd import MD2Reader, MDL_HEAD, RG_POLYGONS, RG_VERTICES, RG_EFFECTS, RG_TEXBLEND, RG_BLENDS, RG_VERTEX, VERTEX_HAS_COLOR
+
+# Persistent index of a directory of .md2 files, refreshed only for files whose size, mtime or contents changed.
+# usage: index_md2.py <directory> [--db file] [--query name | --sql statement]
+
+SCHEMA_VERSION = 1
+SCHEMA = '''
+create table files (
+	id             integer primary key,
+	path           text unique not null,
+	size           integer,
+	mtime          real,
+	hash           text,
+	signature      text,
+	inertiamulti_x real, inertiamulti_y real, inertiamulti_z real,
+	boundingradius real,
+	distancefades  integer,
+	hasboundingbox integer,
+	detaillevels   integer,
+	rendergroups   integer,
+	vertices       integer,
+	polygons       integer,
+	vertex_flags   integer, -- every rendergroup's flags or'ed together
+	error          text
+);
+create table chunks (
+	file   integer references files(id) on delete cascade,
+	name   text, offset integer, size integer
+);
+create table bitmaps (
+	file   integer references files(id) on delete cascade,
+	id     integer, path text, type integer, "index" integer
+);
+create table detaillevels (
+	file   integer references files(id) on delete cascade,
+	id     integer, type integer, maxedgelength real, rendergroups integer
+);
+create table rendergroups (
+	file            integer references files(id) on delete cascade,
+	detaillevel     integer,
+	id              integer,
+	polygons        integer,
+	vertices        integer,
+	effects         integer,
+	texblend_effectmask  integer,
+	texblend_effects     integer,
+	texblend_coordinates integer,
+	texture         integer,
+	vertex_flags    integer,
+	num_texcoords   integer,
+	fill_type       integer
+);
+create index chunks_file       on chunks(file);
+create index bitmaps_file      on bitmaps(file);
+create index detaillevels_file on detaillevels(file);
+create index rendergroups_file on rendergroups(file);
+'''
+
+# the groups of models as defined in "LR2 rare fields.txt"
+QUERIES = {
+	'old'     : "select path from files where signature in ('MDL1', 'MDL0')",
+	'flow'    : 'select distinct path from files join rendergroups on rendergroups.file = files.id where num_texcoords > 1',
+	'colored' : 'select path from files where vertex_flags & %i' % VERTEX_HAS_COLOR,
+	'effects' : 'select distinct path from files join rendergroups on rendergroups.file = files.id where texblend_effects = 2',
+	'distant' : 'select path from files where detaillevels > 1',
+	'rgeffect': 'select distinct path from files join rendergroups on rendergroups.file = files.id where rendergroups.effects != 0',
+	'disorder': 'select distinct files.path from files join bitmaps on bitmaps.file = files.id where bitmaps.id != bitmaps."index"',
+}
+
+def connect(dbpath):
+	db = sqlite3.connect(dbpath)
+	db.execute('pragma foreign_keys = on')
+	if db.execute('pragma user_version').fetchone()[0] != SCHEMA_VERSION:
+		for table in ('rendergroups', 'detaillevels', 'bitmaps', 'chunks', 'files'):
+			db.execute('drop table if exists %s' % table)
+		db.executescript(SCHEMA)
+		db.execute('pragma user_version = %i' % SCHEMA_VERSION)
+	return db
+
+def hashfile(filepath):
+	with open(filepath, 'rb') as f:
+		return sha1(f.read()).hexdigest()
+
+def readmodel(filepath, known_hash = None):
+	"""Everything indexed about one file, as rows for each table, or only its hash when that is known_hash"""
+	model = {'hash': hashfile(filepath), 'chunks': [], 'bitmaps': [], 'detaillevels': [], 'rendergroups': []}
+	if model['hash'] == known_hash: return model
+	try:
+		with MD2Reader(filepath) as reader:
+			model['signature'] = reader.signature.decode('ascii', 'replace')
+			model['chunks'] = [(cn.decode('ascii', 'replace'), offset - 8, cl) for cn, offset, cl in reader.chunks]
+			model['bitmaps'] = [(bitmap_id, *bitmap) for bitmap_id, bitmap in enumerate(reader.bitmaps)]
+			if reader.signature != b'MDL0' and not model['chunks']:
+				model['error'] = 'No chunks; the file is too short or not an .md2'
+				return model
+			if reader.signature != b'MDL0' and reader.header is not None:
+				model['head'] = MDL_HEAD.unpack_from(reader.map, reader.header)
+			for detaillevel_id, (detaillevel, rendergroups) in enumerate(reader.detaillevels):
+				model['detaillevels'] += [(detaillevel_id, detaillevel.type, detaillevel.maxedgelength, detaillevel.rendergroups)]
+				for rendergroup_id, rendergroup in enumerate(rendergroups):
+					header = reader.readheader(rendergroup)
+					texblend = header[RG_TEXBLEND]
+					vertex   = header[RG_VERTEX]
+					model['rendergroups'] += [(
+						detaillevel_id, rendergroup_id,
+						header[RG_POLYGONS], header[RG_VERTICES], header[RG_EFFECTS],
+						texblend[0], texblend[2], texblend[4],
+						header[RG_BLENDS][1],
+						vertex[6], vertex[5],
+						rendergroup.fill_type,
+					)]
+	except (ValueError, StructError) as e:
+		model['error'] = '%s: %s' % (type(e).__name__, e)
+	return model
+
+def readmodels(filepaths, known_hashes, jobs = None):
+	if len(filepaths) < 2 or jobs == 1: return [readmodel(filepath, known_hash) for filepath, known_hash in zip(filepaths, known_hashes)]
+	with Pool(jobs) as pool:
+		return pool.starmap(readmodel, zip(filepaths, known_hashes), chunksize = 8)
+
+def storemodel(db, relative, size, mtime, model):
+	db.execute('delete from files where path = ?', (relative,))
+	head = model.get('head', (None,)*6)
+	rendergroups = model['rendergroups']
+	flags = 0
+	for rendergroup in rendergroups: flags |= rendergroup[9]
+	file_id = db.execute(
+		'insert into files values (null, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+			relative, size, mtime, model['hash'], model.get('signature'),
+			*head,
+			len(model['detaillevels']), len(rendergroups),
+			sum(rendergroup[3] for rendergroup in rendergroups),
+			sum(rendergroup[2] for rendergroup in rendergroups),
+			flags, model.get('error'),
+		)
+	).lastrowid
+	db.executemany('insert into chunks values (%i, ?, ?, ?)'                         % file_id, model['chunks'])
+	db.executemany('insert into bitmaps values (%i, ?, ?, ?, ?)'                     % file_id, model['bitmaps'])
+	db.executemany('insert into detaillevels values (%i, ?, ?, ?, ?)'                % file_id, model['detaillevels'])
+	db.executemany('insert into rendergroups values (%i, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)' % file_id, rendergroups)
+
+def refresh(db, searchdir, jobs = None):
+	"""Bring the index up to date with searchdir; returns the number of files (re)scanned and removed"""
+	known = {row[0]: row[1:] for row in db.execute('select path, size, mtime, hash from files')}
+	found, changed = set(), []
+	for dir, dirs, files in walk(searchdir):
+		for file in files:
+			if not file.lower().endswith('.md2'): continue
+			filepath = join(dir, file)
+			relative = relpath(filepath, searchdir)
+			info = stat(filepath)
+			found.add(relative)
+			if relative in known and known[relative][:2] == (info.st_size, info.st_mtime): continue
+			changed += [(filepath, relative, info.st_size, info.st_mtime)]
+	
+	rescanned = 0
+	for (filepath, relative, size, mtime), model in zip(changed, readmodels([x[0] for x in changed], [known.get(x[1], (None,)*3)[2] for x in changed], jobs)):
+		if relative in known and known[relative][2] == model['hash']: # touched, but the same contents
+			db.execute('update files set size = ?, mtime = ? where path = ?', (size, mtime, relative))
+			continue
+		storemodel(db, relative, size, mtime, model)
+		rescanned += 1
+	
+	removed = set(known) - found
+	db.executemany('delete from files where path = ?', ((relative,) for relative in removed))
+	db.commit()
+	return rescanned, len(removed)
+
+if __name__ == '__main__':
+	parser = ArgumentParser(description = 'Keep an SQLite index of a directory of .md2 files and query it.')
+	parser.add_argument('path', help = 'directory to search for .md2 files')
+	parser.add_argument('--db'   , default = 'md2index.sqlite', help = 'index file, md2index.sqlite by default')
+	parser.add_argument('--jobs' , type = int, default = None, help = 'worker processes for rescanning, defaults to the number of cores')
+	parser.add_argument('--query', choices = sorted(QUERIES), help = 'list the files of a group of models')
+	parser.add_argument('--sql'  , help = 'run a statement against the index and print its rows')
+	args = parser.parse_args()
+	
+	db = connect(args.db)
+	rescanned, removed = refresh(db, args.path, args.jobs)
+	if not (args.query or args.sql):
+		print('Indexed %i files, %i rescanned, %i removed.' % (db.execute('select count(*) from files').fetchone()[0], rescanned, removed))
+	for row in db.execute(QUERIES[args.query] if args.query else args.sql or 'select 1 where 0'):
+		print('\t'.join(map(str, row)))
+	db.close()
\ No newline at end of file
@@ -9,10 +9,16 @@ bl_info = {
 
 if 'bpy' in locals():
 	import importlib
+	if 'stats_atd'  in locals(): importlib.reload(stats_atd)
+	if 'read_atd'   in locals(): importlib.reload(read_atd)
+	if 'parse_atd'  in locals(): importlib.reload(parse_atd)
+	if 'mesh_atd'   in locals(): importlib.reload(mesh_atd)
+	if 'pack_atd'   in locals(): importlib.reload(pack_atd)
 	if 'import_atd' in locals(): importlib.reload(import_atd)
 	if 'export_atd' in locals(): importlib.reload(export_atd)
 
 import os
+import json
 import bpy
 
 from bpy.props import (
@@ -28,8 +34,36 @@ from bpy_extras.io_utils import (
 	orientation_helper_factory,
 	axis_conversion		      ,
 )
+def update_stats(self, context):
+	from . import stats_atd
+	stats_atd.ENABLED = self.stats or bool(os.environ.get('ATD_STATS'))
+
+class ATDPreferences(bpy.types.AddonPreferences):
+	bl_idname = __name__
+	
+	stats = BoolProperty(
+		name		= 'Collect timings',
+		description = 'Time the stages of every import and export and print them as a table, also enabled by the ATD_STATS environment variable',
+		default	    = False,
+		update		= update_stats,
+	)
+	stats_json = StringProperty(
+		name		= 'Timings file',
+		description = 'Also write the timings to this JSON file',
+		subtype		= 'FILE_PATH',
+	)
+	
+	def draw(self, context):
+		self.layout.prop(self, 'stats')
+		self.layout.prop(self, 'stats_json')
+
+def report_stats(context):
+	from . import stats_atd
+	addon = context.user_preferences.addons.get(__name__)
+	stats_atd.report(bpy.path.abspath(addon.preferences.stats_json) if addon and addon.preferences.stats_json else None)
+
 class ImportATD(bpy.types.Operator, ImportHelper):
-	"""Import an Attention To Detail .MD2 file"""
+	"""Import Attention To Detail .MD2 files; several are parsed in parallel where processes can fork, and one after another on Windows"""
 	bl_idname  = 'import_mesh.atd'
 	bl_label   = 'Import Attention To Detail .MD2'
 	bl_options = {'UNDO'}
@@ -52,17 +86,33 @@ class ImportATD(bpy.types.Operator, ImportHelper):
 		description = 'Generate a text object to preserve model settings, like shading',
 		default	    = True,
 	)
+	md2_detaillevels = EnumProperty(
+		name		= 'Detail levels',
+		description = 'Detail levels to build; the rest stay on disk and can be loaded later from the root object',
+		items	    = (
+			('ALL' , 'All'      , 'Every detail level'),
+			('BASE', 'Base mesh', 'Only the first detail level, leaving the distant meshes on disk'),
+		)
+	)
+	md2_bitmapfilter = StringProperty(
+		name		= 'Bitmap filter',
+		description = 'Only build render groups whose bitmap path contains one of these comma separated words; empty for all',
+		default	    = '',
+	)
 	
 	def execute(self, context):
 		paths = [os.path.join(self.directory, name.name) for name in self.files]
 		keywords = {
-			'usebitmaps': self.md2_usebitmaps,
-			'use_text'  : self.md2_usetext,
+			'usebitmaps'  : self.md2_usebitmaps,
+			'usetext'     : self.md2_usetext,
+			'detaillevels': {0} if self.md2_detaillevels == 'BASE' else None,
+			'bitmaps'     : [x.strip() for x in self.md2_bitmapfilter.split(',') if x.strip()] or None,
 		}
 		if not paths: paths.append(self.filepath)
 		from . import import_atd
-		for path in paths:
-			import_atd.open_atd(path, **keywords)
+		for path, error in import_atd.open_many(paths, **keywords):
+			self.report({'WARNING'}, 'Failed to import "%s": %s' % (path, error))
+		report_stats(context)
 		return {'FINISHED'}
 		
 class ExportATD(bpy.types.Operator, ExportHelper):
@@ -88,28 +138,151 @@ class ExportATD(bpy.types.Operator, ExportHelper):
 		description = 'Use the model text object for options including shading',
 		default	    = True,
 	)
+	md2_usestrips = BoolProperty(
+		name		= 'Triangle strips',
+		description = 'Write each render group as one triangle strip where that takes fewer indices than a triangle list',
+		default	    = False,
+	)
+	md2_cacheorder = BoolProperty(
+		name		= 'Optimize vertex cache',
+		description = 'Reorder faces and vertices of each render group for reuse of transformed vertices',
+		default	    = False,
+	)
+	md2_searchyaw = BoolProperty(
+		name		= 'Turn bounding box',
+		description = 'Turn the bounding box about the vertical axis to the least volume, instead of aligning it to the axes',
+		default	    = False,
+	)
+	md2_weld = FloatProperty(
+		name		= 'Weld distance',
+		description = 'Merge vertices whose position, normal and uv all match within this distance; 0 disables',
+		default	    = 0.,
+		min			= 0.,
+		precision	= 5,
+	)
+	md2_merge = BoolProperty(
+		name		= 'Merge render groups',
+		description = 'Write one render group per bitmap in each detail level, in bitmap order, instead of one per mesh object',
+		default	    = False,
+	)
+	md2_lodratios = StringProperty(
+		name		= 'Distant meshes',
+		description = 'Comma separated face ratios of the distant detail levels to generate for roots with only a base mesh, like 0.25; empty for none',
+		default	    = '',
+	)
 
 	def execute(self, context):
 		from . import export_atd
 		keywords = {
-			'version' : self.md2_version,
-			'use_text': self.md2_usetext,
+			'version'           : self.md2_version,
+			'use_text'          : self.md2_usetext,
+			'use_strips'        : self.md2_usestrips,
+			'use_cache_order'   : self.md2_cacheorder,
+			'weld_epsilon'      : self.md2_weld,
+			'search_yaw'        : self.md2_searchyaw,
+			'merge_rendergroups': self.md2_merge,
+			'lod_ratios'        : [float(x) for x in self.md2_lodratios.split(',') if x.strip()],
 		}
-		export_atd.write_atd(self.filepath, **keywords)
+		for line in export_atd.write_atd(self.filepath, **keywords):
+			self.report({'INFO'}, line)
+		report_stats(context)
 		return {'FINISHED'}
 		
+class LoadSkippedATD(bpy.types.Operator):
+	"""Build the detail levels and render groups that were left on disk when this model was imported"""
+	bl_idname  = 'object.atd_load_skipped'
+	bl_label   = 'Load skipped render groups'
+	bl_options = {'UNDO'}
+	
+	@classmethod
+	def poll(cls, context):
+		return context.object is not None and 'atd_filepath' in context.object
+	
+	def execute(self, context):
+		from . import import_atd
+		self.report({'INFO'}, 'Loaded %i render groups.' % import_atd.loadskipped(context.object))
+		report_stats(context)
+		return {'FINISHED'}
+
+class ATDPanel(bpy.types.Panel):
+	bl_label       = 'Attention To Detail .MD2'
+	bl_space_type  = 'PROPERTIES'
+	bl_region_type = 'WINDOW'
+	bl_context     = 'object'
+	
+	@classmethod
+	def poll(cls, context):
+		return LoadSkippedATD.poll(context)
+	
+	def draw(self, context):
+		self.layout.label(text = context.object['atd_filepath'])
+		self.layout.operator(LoadSkippedATD.bl_idname)
+		
+class MetadataATD(bpy.types.Operator, ImportHelper):
+	"""Read the header, bitmaps and render group counts of an Attention To Detail .MD2 file without importing it"""
+	bl_idname    = 'wm.atd_metadata'
+	bl_label     = 'Inspect .MD2'
+	filename_ext = ".md2"
+	filter_glob  = StringProperty(default="*.md2", options={'HIDDEN'})
+	
+	def execute(self, context):
+		from .parse_atd import metadata
+		try: info = metadata(self.filepath)
+		except Exception as error:
+			self.report({'ERROR'}, 'Could not read "%s": %s' % (self.filepath, error))
+			return {'CANCELLED'}
+		context.window_manager.atd_metadata = json.dumps(info)
+		self.report({'INFO'}, '%s: %i bitmaps, %i detail levels.' % (info['signature'], len(info['bitmaps']), len(info['detaillevels'])))
+		return {'FINISHED'}
+
+class ATDMetadataPanel(bpy.types.Panel):
+	bl_label       = 'Attention To Detail .MD2'
+	bl_space_type  = 'VIEW_3D'
+	bl_region_type = 'TOOLS'
+	bl_category    = 'ATD'
+	
+	def draw(self, context):
+		layout = self.layout
+		layout.operator(MetadataATD.bl_idname)
+		if not context.window_manager.atd_metadata: return
+		info = json.loads(context.window_manager.atd_metadata)
+		layout.label(text = os.path.basename(info['filepath']))
+		layout.label(text = '%s, %i bytes, radius %.03f' % (info['signature'], info['size'], info['boundingradius']))
+		box = layout.box()
+		for bitmap_id, bitmap in enumerate(info['bitmaps']):
+			box.label(text = '%i: %s' % (bitmap_id, bitmap))
+		for detaillevel_id, detaillevel in enumerate(info['detaillevels']):
+			box = layout.box()
+			box.label(text = 'Detail level %i (type %i)' % (detaillevel_id, detaillevel['type']))
+			for rendergroup_id, rendergroup in enumerate(detaillevel['rendergroups']):
+				box.label(text = '%i: %i polygons, %i vertices, bitmap %i' % (rendergroup_id, rendergroup['polygons'], rendergroup['vertices'], rendergroup['texture']))
+		
 def menu_func_import(self, context):
 	self.layout.operator(ImportATD.bl_idname, text="Attention To Detail (.md2)")
 def menu_func_export(self, context):
 	self.layout.operator(ExportATD.bl_idname, text="Attention To Detail (.md2)")
 def register():
+	bpy.utils.register_class(ATDPreferences)
+	addon = bpy.context.user_preferences.addons.get(__name__)
+	if addon: update_stats(addon.preferences, bpy.context)
 	bpy.utils.register_class(ImportATD)
 	bpy.utils.register_class(ExportATD)
+	bpy.utils.register_class(LoadSkippedATD)
+	bpy.utils.register_class(ATDPanel)
+	bpy.utils.register_class(MetadataATD)
+	bpy.utils.register_class(ATDMetadataPanel)
+	bpy.types.WindowManager.atd_metadata = StringProperty() # JSON of the last inspected file
 	bpy.types.INFO_MT_file_import.append(menu_func_import)
 	bpy.types.INFO_MT_file_export.append(menu_func_export)
 def unregister():
+	bpy.utils.unregister_class(ATDPreferences)
 	bpy.utils.unregister_class(ImportATD)
 	bpy.utils.unregister_class(ExportATD)
+	bpy.utils.unregister_class(LoadSkippedATD)
+	bpy.utils.unregister_class(ATDPanel)
+	bpy.utils.unregister_class(MetadataATD)
+	bpy.utils.unregister_class(ATDMetadataPanel)
+	del bpy.types.WindowManager.atd_metadata
 	bpy.types.INFO_MT_file_import.remove(menu_func_import)
 	bpy.types.INFO_MT_file_export.remove(menu_func_export)
 if __name__ == "__main__": register()
\ No newline at end of file
@@ -1,7 +1,13 @@
-from struct import pack
 import bpy, bmesh
+import numpy as np
 from io import BytesIO as bio
 
+from .mesh_atd import splitvertices, weldvertices, decimate, mergemeshes, splitfaces, stripify, acmr, optimizefaces, renumbervertices, maxedgelength, bounds
+from .pack_atd import packmdl2, writeatomic
+from .stats_atd import timed, count
+
+DEFAULT_TEXBLEND = (0xFFFFFFFF, 0xFFFF, 0x0F, 0x03)
+
 f2i = lambda s, f = {}: sum(leval(x[:10]) if x.startswith('0x') else int(x) if x.isnumeric() else f[x] for x in s.replace(' ', '').split('|'))
 b2i = lambda s: int(s) if s.isnumeric() else {'true': 1, 'false': 2}[s.lower()]
 
@@ -10,7 +16,7 @@ def write_atd(filepath, **kwargs):
 	v = kwargs['version']
 	del kwargs['version']
 	print('Version:', v)
-	if   v == 'MDL2': write_mdl2(filepath, **kwargs)
+	if   v == 'MDL2': return write_mdl2(filepath, **kwargs)
 	#elif v == 'MDL1': write_mdl1(filepath, **kwargs)
 	#elif v == 'MDL0': write_mdl0(filepath, **kwargs)
 	else: raise AssertionError('Invalid version.')
@@ -26,169 +32,207 @@ def write_atd(filepath, **kwargs):
 #   Vector: (Center)
 #   Float : (Rotation Y)
 
+def gatherrendergroup(rendergroup):
+	"""Positions, normals, uvs and triangles of a rendergroup, with vertices split along uv and normal seams"""
+	dl_mesh = bmesh.new()
+	dl_mesh.from_object(rendergroup, bpy.context.scene)
+	bmesh.ops.triangulate(dl_mesh, faces = dl_mesh.faces)
+	work_mesh = bpy.data.meshes.new(rendergroup.name)
+	dl_mesh.to_mesh(work_mesh)
+	dl_mesh.free()
+	work_mesh.use_auto_smooth   = rendergroup.data.use_auto_smooth # bmesh drops these, without which calc_normals_split ignores custom normals
+	work_mesh.auto_smooth_angle = rendergroup.data.auto_smooth_angle
+	try: uvlayer = work_mesh.uv_layers[0]
+	except IndexError: raise IndexError('Model does not have a UV map.')
+	work_mesh.calc_normals_split()
+	
+	loops = len(work_mesh.loops)
+	co          = np.empty(len(work_mesh.vertices) * 3, np.float32)
+	loop_vertex = np.empty(loops,     np.int32  )
+	loop_normal = np.empty(loops * 3, np.float32)
+	loop_uv     = np.empty(loops * 2, np.float32)
+	loop_start  = np.empty(len(work_mesh.polygons), np.int32)
+	work_mesh.vertices.foreach_get('co', co)
+	work_mesh.loops.foreach_get('vertex_index', loop_vertex)
+	work_mesh.loops.foreach_get('normal', loop_normal)
+	uvlayer.data.foreach_get('uv', loop_uv)
+	work_mesh.polygons.foreach_get('loop_start', loop_start)
+	bpy.data.meshes.remove(work_mesh)
+	
+	loop_normal = loop_normal.reshape(-1, 3)
+	loop_uv     = loop_uv.reshape(-1, 2)
+	vertex_loops, loop_split = splitvertices(loop_vertex, loop_normal, loop_uv)
+	faces = loop_split[loop_start[:, None] + np.arange(3)]
+	return co.reshape(-1, 3)[loop_vertex[vertex_loops]], loop_normal[vertex_loops], loop_uv[vertex_loops], faces
+
+@timed('write_mdl2')
 def write_mdl2(filepath,
-	bounding_radius = 5,
+	bounding_radius = None, # the sphere around the vertices when None
 	distance_fades = True,
 	use_bounding_box = True,
+	search_yaw = False, # turn the bounding box about y to the least volume
 	matprops = 3, # crashes if 1
+	use_text = True, # the settings text is not read back yet
+	use_strips = False,
+	use_cache_order = False,
+	weld_epsilon = 0., # 0 to keep near duplicate vertices
+	lod_ratios = (), # face ratios of the distant detail levels generated for roots with only a base mesh
+	merge_rendergroups = False, # one render group per bitmap and detail level, in bitmap order
 ):
-	meshroots    = []
+	for ratio in lod_ratios: assert 0 < ratio < 1, 'Distant mesh ratio %s is not between 0 and 1.' % ratio
+	meshroots    = [] # [detail level, [(rendergroup, bitmap id)], detail level type, ratio to decimate the rendergroups to or None]
 	bitmap_paths = []
 	validroot    = False
 	for root in bpy.data.objects:
 		if root.type == 'EMPTY' and root.parent == None:
+			root_start = len(meshroots)
 			for detaillevel in root.children:
 				if detaillevel.type == 'EMPTY':
 					assert detaillevel.children, 'Detail level "%s" has no children.' % detaillevel.name
-					meshroots += [[detaillevel, []]]
+					meshroots += [[detaillevel, [], 1 if len(meshroots) == root_start else 2, None]]
 					validmesh = False
 					for rendergroup in detaillevel.children:
 						if rendergroup.type == 'MESH':
 							assert rendergroup.material_slots, 'Render group "%s" has no material slots; there must be 1.' % rendergroup.name
-							bitmap_path = rendergroup.material_slots[0].name
+							material = rendergroup.material_slots[0].material
+							bitmap_path = material.get('atd_bitmap', material.name) if material else rendergroup.material_slots[0].name
 							assert bitmap_path, 'Render group "%s"\'s 1st material slot is unnamed; name it a texture path.' % rendergroup.name
 							assert bitmap_path.lower().startswith('game data'), 'Render group "%s"\'s 1st material slot does not start with the game data path "game data".' % rendergroup.name
 							validmesh = True
 							if bitmap_path not in bitmap_paths: bitmap_paths += [bitmap_path]
 							meshroots[-1][1] += [(rendergroup, bitmap_paths.index(bitmap_path))]
 						assert validmesh, 'Detail level "%s" has no valid mesh.' % detaillevel.name
+			if len(meshroots) == root_start + 1: # generated from the base mesh, which keeps its objects
+				meshroots += [[meshroots[root_start][0], meshroots[root_start][1], 2, ratio] for ratio in lod_ratios]
 	assert meshroots, 'Could not find any valid roots. Import an .md2 to see the required hierarchy.'
 	
-	f = open(filepath, 'wb')
-	
-	for chunkname in (b'MDL2', b'GEO1'):
-		f.write(chunkname + b'\0\0\0\0')
-		chunkstart = f.tell()
-		if chunkname == b'MDL2':
-			f.write(
-				pack('f', 1.5)*3 # inertia multiplier
-				+ pack('f', bounding_radius)
-				+ pack('I', distance_fades)
-				+ pack('I', use_bounding_box)
-			)
-			if use_bounding_box:
-				f.write(
-					pack('3f', -2, -2, -2) #min
-					+pack('3f', 2, 2, 2) #max
-					+pack('3f', 0, 0, 0) #center
-					+pack('f', -.0) #rotation y
-				)
-			f.write(
-				pack('4I', 0, 0, 0, 0)
-				+ b'\0'*48
-			)
-			f.write(
-				pack('I', len(bitmap_paths))
-			)
-			for index, path in enumerate(bitmap_paths):
-				encodedpath = path.encode('ascii')
-				assert len(encodedpath) <= 255, 'The bitmap path "%s" is too long; it must be below 256 characters.' % path
-				f.write(
-					pack('256s', encodedpath)
-					+ pack('I', 0) # type
-					+ pack('I', index) # type
-				)
-			f.write( # matprops
-				pack('I', matprops)
-			)
-			for matprop in range(matprops):
-				f.write(
-					pack('4f',  0.3764,0.3764,0.3764,0.3764,)
-					+pack('4f', 0.5019,0.5019,0.5019,0.5019,)
-					+pack('4f', 0.6588,0.6588,0.6588,0.6588,)
-					+pack('4f', 0,0,0,0)
-					+pack('f', 0)
-					+pack('f', 0)
-					+pack('I', 0)
-					+pack('I', 0)
-					+pack('8s', b'RRU') # "anim name" in liblr2, but i think it's unused
-				)
-		elif chunkname == b'GEO1':
-			f.write(pack('I', len(meshroots)))
-			detaillevel_id = 0
-			for detaillevel, rendergroups in meshroots:
-				f.write(
-					pack('I', 1) # set in official models, but unused by the game; 1 for normal mesh, 2 for lod, but it determines lod from the detail level definition being first or second
-					+ pack('f', 5) # max edge length, unknown purpose
-					+ pack('I', len(rendergroups))
-					+ b'\0'*8
-				)
-				
-				for rendergroup, bitmap_id in rendergroups:
-					dl_mesh = bmesh.new()
-					dl_mesh.from_object(rendergroup, bpy.context.scene)
-					dl_mesh.faces.ensure_lookup_table()
-					dl_mesh.verts.ensure_lookup_table()
-					dl_mesh.verts.index_update()
-					
-					f.write(
-						pack('H', len(dl_mesh.faces))
-						+ pack('H', len(dl_mesh.verts))
-						+ pack('H', 1) # "material"
-						+ pack('H', 0) # "effects"
-						+ b'\0'*12
-					)
-					f.write(
-						pack('H', 1)
-						+ pack('H', 0)
-						+ pack('H', 1)
-						+ pack('B', 0)
-						+ pack('B', 1)
-					)
-					for texblend in (
-						(
-							pack('I', 0)
-							+ pack('H', bitmap_id)
-							+ pack('B', 0)
-							+ pack('B', 3) # 3 = tiling enabled, 0 = disabled
-						),
-						*(b'\xff\xff\xff\xff\xff\xff\x0f\x03',)*3,
-					):
-						f.write(texblend)
-					f.write(
-						pack('i', 0) #geo1_vertex_offset_vector  ,\
-						+ pack('i', 12) #geo1_vertex_offset_normal  ,\
-						+ pack('i', 0) #geo1_vertex_offset_colour  ,\
-						+ pack('i', 24) #geo1_vertex_offset_texcoord,\
-						+ pack('I', 32) #geo1_vertex_size_vertstruct,\
-						+ pack('I', 1) #geo1_vertex_num_texcoords  ,\
-						+ pack('H', 0b1011) #geo1_vertex_flags          ,\
-						+ pack('H', len(dl_mesh.verts)) #geo1_vertex_vertices       ,\
-						+ pack('H', 1) #geo1_vertex_managedbuffer  ,\
-						+ pack('H', 0) #geo1_vertex_currentvertex # looks unused, appears as a partially overwritten float in the official files
-						+ b'\0'*8
-					)
-					try: uvlayer = dl_mesh.loops.layers.uv[0]
-					except IndexError: raise IndexError('Model does not have a UV map.')
-					for vert in dl_mesh.verts:
-						uv = ()
-						for face in dl_mesh.faces:
-							for loop in face.loops:
-								if loop.vert.index == vert.index:
-									uv = loop[uvlayer].uv
-						assert uv, 'Did not find UV for vertex %i.' % vert
-						f.write(
-							pack('3f', *tuple(vert.co)[::-1])
-							+ pack('3f', *tuple(vert.normal)[::-1])
-							+ pack('2f', *uv)
-						)
-						
-					f.write(
-						pack('I', 1)
-						+ pack('I', 0)
-						+ pack('I', len(dl_mesh.faces)*3)
-					)
-					for face in dl_mesh.faces:
-						f.write(
-							pack('3H', *(v.index for v in face.verts))
-						)
-				detaillevel_id += 1
-		chunkend = f.tell()
-		f.seek(chunkstart - 4)
-		f.write(pack('I', chunkend - chunkstart))
-		f.seek(chunkend)
+	geo1_detaillevels = []
+	list_indices = strip_indices = 0
+	misses_before = misses_after = face_count = 0
+	vertices_before = vertices_after = 0
+	split_before = split_after = 0
+	unmerged_rendergroups = 0 # as split without merging
+	all_positions = []
+	welded  = {} # rendergroup name: geometry, kept for the detail levels generated from it
+	lod_report = []
+	for detaillevel, rendergroups, detaillevel_type, ratio in meshroots:
+		geo1_rendergroups = []
+		detaillevel_maxedgelength = 0.
+		faces_before = faces_after = 0
+		meshes = [] # (bitmap id, (positions, normals, uvs, faces))
+		for rendergroup, bitmap_id in rendergroups:
+			if rendergroup.name in welded:
+				positions, normals, uvs, faces = welded[rendergroup.name]
+			else:
+				positions, normals, uvs, faces = gatherrendergroup(rendergroup)
+				if weld_epsilon > 0:
+					vertices_before += len(positions)
+					kept, faces = weldvertices(positions, normals, uvs, faces, weld_epsilon)
+					positions, normals, uvs = positions[kept], normals[kept], uvs[kept]
+					vertices_after  += len(positions)
+				if lod_ratios: welded[rendergroup.name] = positions, normals, uvs, faces
+			if ratio is not None:
+				faces_before += len(faces)
+				positions, normals, uvs, faces = decimate(positions, normals, uvs, faces, ratio)
+				faces_after  += len(faces)
+			meshes += [(bitmap_id, (positions, normals, uvs, faces))]
+		if merge_rendergroups: # every render group is written with the same texblend fields, so all those of a bitmap can be drawn as one
+			unmerged_rendergroups += sum(len(splitfaces(*mesh[::3])) for bitmap_id, mesh in meshes)
+			meshes = [(bitmap_id, mergemeshes([mesh for mesh_bitmap_id, mesh in meshes if mesh_bitmap_id == bitmap_id])) for bitmap_id in sorted({bitmap_id for bitmap_id, mesh in meshes})]
+		for bitmap_id, (positions, normals, uvs, faces) in meshes:
+			parts = splitfaces(positions, faces)
+			if len(parts) > 1:
+				split_before += 1
+				split_after  += len(parts)
+			for positions, normals, uvs, faces in [(positions[part], normals[part], uvs[part], part_faces) for part, part_faces in parts]:
+				if use_cache_order:
+					misses_before += acmr(faces) * len(faces)
+					order, faces = renumbervertices(optimizefaces(faces))
+					positions, normals, uvs = positions[order], normals[order], uvs[order]
+					misses_after  += acmr(faces) * len(faces)
+					face_count    += len(faces)
+				all_positions += [positions[:, ::-1]]
+				detaillevel_maxedgelength = max(detaillevel_maxedgelength, maxedgelength(positions, faces))
+				fill_type, indices, polygons = 0, faces, len(faces) # triangle list
+				if use_strips:
+					strip = stripify(faces)
+					if len(strip) < faces.size and len(strip) - 2 <= 0xFFFF: fill_type, indices, polygons = 1, strip, len(strip) - 2 # polygons of a strip count its degenerates
+					list_indices  += faces.size
+					strip_indices += indices.size
+				geo1_rendergroups += [(
+					(
+						polygons      , # polygons
+						len(positions), # vertices
+						1             , # "material"
+						0             , # "effects"
+						1, 0, 1, 0, 1 , # texblend effect mask, render reference, effects, custom, coordinates
+						0, bitmap_id, 0, 3, # effect, texture index, coordinate index, tiling info (3 = tiling enabled, 0 = disabled)
+						*DEFAULT_TEXBLEND*3,
+						0             , # geo1_vertex_offset_vector
+						12            , # geo1_vertex_offset_normal
+						0             , # geo1_vertex_offset_colour
+						24            , # geo1_vertex_offset_texcoord
+						32            , # geo1_vertex_size_vertstruct
+						1             , # geo1_vertex_num_texcoords
+						0b1011        , # geo1_vertex_flags
+						len(positions), # geo1_vertex_vertices
+						1             , # geo1_vertex_managedbuffer
+						0             , # geo1_vertex_currentvertex # looks unused, appears as a partially overwritten float in the official files
+					),
+					np.hstack((positions[:, ::-1], normals[:, ::-1], uvs)),
+					fill_type,
+					indices,
+				)]
+		if ratio is not None:
+			lod_report += ['Distant mesh of "%s": %i faces instead of %i' % (detaillevel.parent.name, faces_after, faces_before)]
+		geo1_detaillevels += [(
+			detaillevel_type, # unused by the game, which tells lod from the detail level definition being first or second; 1 for normal mesh, 2 for lod as in official models
+			detaillevel_maxedgelength, # the distance between the two most distant connected vertices
+			geo1_rendergroups,
+		)]
 	
-	f.close()
+	box_min, box_max, box_center, box_yaw, radius = bounds(np.concatenate(all_positions), 90 if search_yaw else 0) # in file order, a degree apart
+	buffer = packmdl2(
+		(1.5, 1.5, 1.5), # inertia multiplier
+		radius if bounding_radius is None else bounding_radius,
+		distance_fades,
+		(
+			*box_min   ,
+			*box_max   ,
+			*box_center,
+			box_yaw    , # rotation y
+		) if use_bounding_box else None,
+		(0, 0, 0, 0),
+		[(path, 0, index) for index, path in enumerate(bitmap_paths)],
+		[(
+			*(0.3764,)*4,
+			*(0.5019,)*4,
+			*(0.6588,)*4,
+			*(0     ,)*4,
+			0, 0, 0, 0,
+			b'RRU', # "anim name" in liblr2, but i think it's unused
+		)]*matprops,
+		geo1_detaillevels,
+	)
+	writeatomic(filepath, buffer)
+	count(
+		bytes    = len(buffer),
+		vertices = sum(len(rendergroup[1]) for detaillevel in geo1_detaillevels for rendergroup in detaillevel[2]),
+		indices  = sum(rendergroup[3].size for detaillevel in geo1_detaillevels for rendergroup in detaillevel[2]),
+	)
+	report = lod_report
+	if merge_rendergroups:
+		report += ['Draw calls: %i render groups instead of %i' % (sum(len(detaillevel[2]) for detaillevel in geo1_detaillevels), unmerged_rendergroups)]
+	if split_before:
+		report += ['Splitting: %i render groups over 65535 vertices or polygons into %i' % (split_before, split_after)]
+	if weld_epsilon > 0:
+		report += ['Welding: %i vertices instead of %i' % (vertices_after, vertices_before)]
+	if use_cache_order:
+		report += ['Vertex cache: ACMR %.03f instead of %.03f' % (misses_after / max(face_count, 1), misses_before / max(face_count, 1))]
+	if use_strips:
+		report += ['Triangle strips: %i indices instead of %i (%i saved)' % (strip_indices, list_indices, list_indices - strip_indices)]
+	for line in report: print(line)
+	return report
 	
 def write_mdl1(filepath):
 	NotImplemented
@@ -1,14 +1,20 @@
-from struct  import unpack
-from sys     import argv
-from os.path import split, splitext, join
-from io      import BytesIO as bio
-from ast     import literal_eval as leval
-import bpy, bmesh
-	
-VERTEX_HAS_VECTOR = 0b0001 # invariable
-VERTEX_HAS_NORMAL = 0b0010 # invariable
-VERTEX_HAS_COLOR  = 0b0100 # only set in a few models
-VERTEX_HAS_UV     = 0b1000 # invariable
+from struct   import unpack
+from sys      import argv
+from os       import walk, sep
+from os.path  import split, splitext, join, dirname, relpath, abspath, normcase
+from ast      import literal_eval as leval
+import bpy
+import numpy as np
+
+from .read_atd import (
+	VERTEX_HAS_VECTOR,
+	VERTEX_HAS_NORMAL,
+	VERTEX_HAS_COLOR ,
+	VERTEX_HAS_UV    ,
+)
+from .parse_atd import parse, parsemany
+from .mesh_atd  import sanitizefaces, renumbervertices
+from .stats_atd import timed, count
 
 BUFFERACCESSFLAGS = {
 	1: 'READ' ,
@@ -33,33 +39,56 @@ def readnulltermstring(input, skip=False):
 		if not c or c == b'\0': return buildstring
 		buildstring += c
 
+@timed('open_atd')
 def open_atd(filepath, **kwargs):
-	first4 = open(filepath,'rb').read(4)
+	first4 = kwargs['model'].header.signature if kwargs.get('model') else open(filepath,'rb').read(4)
 	if   first4 == b'MDL0': return open_mdl0(filepath, **kwargs)
 	elif first4 == b'MDL1': return open_mdl1(filepath, **kwargs)
 	elif first4 == b'MDL2': return open_mdl2(filepath, **kwargs)
 	elif first4 == b'MDL3': return open_mdl3(filepath, **kwargs)
 	else: raise AssertionError('Input file is not a supported type; expected signature to be MDL2, MDL1, or MDL0, recieved "%s".' % str(first4)[2:-1])
 
-def buildfaces(work_bmesh, mdl0_fill_type, mdl0_polygons, f):
-	if mdl0_fill_type == 0:
-		for face in range(mdl0_polygons):
-			try:
-				work_bmesh.faces.new((work_bmesh.verts[x] for x in unpack('3H', f.read(6))))
-			except ValueError: # accounts for models of type double, but does not fix the problem
-				print('Face %i is two-sided, and this is unsupported.' % face)
-	elif mdl0_fill_type == 1:
-		vertexbuffer = [*unpack('2H', f.read(4))]
-		for face in range(mdl0_polygons):
-			print(hex(f.tell()))
-			vertexbuffer += [*unpack('H', f.read(2))]
-			try:
-				work_bmesh.faces.new(work_bmesh.verts[v] for v in vertexbuffer)
-			except ValueError:
-				print('Face %i is two-sided, and this is unsupported.' % face)
-			del vertexbuffer[0]
-	else:
-		raise AssertionError('Unsupported primitive fill type. (%i)' % mdl0_fill_type)
+def open_many(filepaths, jobs = None, **kwargs):
+	"""Import several files, parsed concurrently while the objects are built here on the main thread. Returns the failures as (filepath, error)"""
+	if len(filepaths) < 2:
+		for filepath in filepaths: open_atd(filepath, **kwargs)
+		return []
+	failures = []
+	select = {name: kwargs[name] for name in ('detaillevels', 'bitmaps') if name in kwargs}
+	models = parsemany(filepaths, jobs, **select)
+	try:
+		for filepath, model, error in models:
+			if error is not None:
+				print('Failed to parse "%s": %s' % (filepath, error))
+				failures += [(filepath, error)]
+				continue
+			open_atd(filepath, model = model, **kwargs)
+	finally:
+		models.close() # frees the shared memory of the files not built yet
+	return failures
+
+def buildmesh(name, positions, faces, normals, uvs):
+	"""Fill a new mesh straight from flat arrays; per-loop data is gathered from the per-vertex arrays through the face indices"""
+	loops = faces.ravel().astype(np.int32)
+	work_mesh = bpy.data.meshes.new(name)
+	work_mesh.vertices.add(len(positions))
+	work_mesh.loops.add(len(loops))
+	work_mesh.polygons.add(len(faces))
+	work_mesh.vertices.foreach_set('co', positions.ravel())
+	work_mesh.loops.foreach_set('vertex_index', loops)
+	work_mesh.polygons.foreach_set('loop_start', np.arange(0, len(loops), 3, dtype = np.int32))
+	work_mesh.polygons.foreach_set('loop_total', np.full(len(faces), 3, dtype = np.int32))
+	work_mesh.polygons.foreach_set('use_smooth', [True] * len(faces)) # the file has a normal per vertex, not per face
+	work_mesh.uv_textures.new()
+	work_mesh.uv_layers[0].data.foreach_set('uv', uvs[loops].ravel())
+	work_mesh.update(calc_edges = True)
+	work_mesh.validate() # faces are sanitized beforehand, this only guards against what slipped through
+	
+	#### normal test
+	work_mesh.normals_split_custom_set_from_vertices(normals)
+	work_mesh.use_auto_smooth = True
+	#### normal test
+	return work_mesh
 
 #def buildbitmaplist(f, head_bitmap_count):
 #	bitmaps = [None]*head_bitmap_count
@@ -75,34 +104,150 @@ def buildfaces(work_bmesh, mdl0_fill_type, mdl0_polygons, f):
 #	assert None not in bitmaps and len(bitmaps) == head_bitmap_count, 'There was an error in sorting the bitmaps.'
 #	return bitmaps
 	
-def buildbitmaplist(f, head_bitmap_count):
-	bitmaps = []
-	print('Bitmaps:', head_bitmap_count)
-	for bitmap_id in range(head_bitmap_count):
-		bitmap_path = readnulltermstring(f.read(256)).decode('utf8')
-		(
-			bitmap_type ,
-			bitmap_index,
-		) = unpack('2I', f.read(8))
-		print(('\t %s ' % bitmap_index) + bitmap_path)
-		bitmaps += [(bitmap_path, bitmap_type, bitmap_index)]
-	return bitmaps
+def buildbitmaplist(model):
+	return [(bitmap.path, bitmap.type, bitmap.index) for bitmap in model.bitmaps]
 		
-def openbitmaps(filepath, bitmaps): # only works on lego racers 2's .mip (renamed .tga)
-	try: rootpath = filepath[:filepath.lower().index('game data')]
-	except ValueError: print('Could not trace back to root directory "GAME DATA".')
-	else:
-		for bitmap in bitmaps:
-			mip = splitext(bitmap[0])[0] + '.mip'
-			try: bpy.ops.image.open(filepath = join(rootpath, mip))
-			except RuntimeError: print('Failed to open image "%s".' % mip)
+GAMEDATA = {} # game data directory: {lowercase path from its parent, with forward slashes: path on disk}
+
+def indexgamedata(gamedata):
+	"""Case-insensitive index of every file under a game data directory, built once per directory"""
+	if gamedata not in GAMEDATA:
+		parent, index = dirname(gamedata), {}
+		for root, dirs, files in walk(gamedata):
+			for name in files:
+				path = join(root, name)
+				index[relpath(path, parent).replace(sep, '/').lower()] = path
+		GAMEDATA[gamedata] = index
+	return GAMEDATA[gamedata]
+
+def findbitmap(filepath, bitmap_path): # only works on lego racers 2's .mip (renamed .tga)
+	"""Path on disk of a bitmap's .mip, or None; bitmap paths are relative to the parent of the "GAME DATA" directory"""
+	try: gamedata = filepath[:filepath.lower().rindex('game data') + 9]
+	except ValueError: return None
+	return indexgamedata(gamedata).get(splitext(bitmap_path.replace('\\', '/'))[0].lower() + '.mip')
+
+@timed('openbitmaps')
+def openbitmaps(filepath, bitmaps):
+	"""Images for the bitmaps in order, None where the file was not found; images already loaded from the same file are reused"""
+	if 'game data' not in filepath.lower():
+		print('Could not trace back to root directory "GAME DATA".')
+		return [None] * len(bitmaps)
+	loaded = {normcase(abspath(bpy.path.abspath(image.filepath))): image for image in bpy.data.images if image.filepath}
+	images = []
+	for bitmap in bitmaps:
+		path = findbitmap(filepath, bitmap[0])
+		if path is None:
+			print('Failed to find image "%s".' % bitmap[0])
+			images += [None]
+			continue
+		key = normcase(abspath(path))
+		if key not in loaded:
+			try: loaded[key] = bpy.data.images.load(path)
+			except RuntimeError: print('Failed to open image "%s".' % path)
+			else: count(images_loaded = 1)
+		else: count(images_reused = 1)
+		images += [loaded.get(key)]
+	return images
+
+MATERIALS = {} # material key: material name, for every material made by the importer in this session or saved in the .blend
 
-def open_mdl2(filepath, usebitmaps = True, usetext = True):
-	f = open(filepath,'rb')
+def materialkey(bitmap_path, matprop = None):
+	return repr((bitmap_path.replace('\\', '/').lower(), tuple(matprop) if matprop is not None else None))
+
+def getmaterial(bitmap_path, matprop = None):
+	"""The one material for a bitmap and matprop pair, shared by every import and found again in saved .blend files through its key"""
+	key = materialkey(bitmap_path, matprop)
+	material = bpy.data.materials.get(MATERIALS.get(key, ''))
+	if material is None or material.get('atd_key') != key: # not made yet, or renamed, removed, or undone since
+		MATERIALS.clear()
+		MATERIALS.update((material['atd_key'], material.name) for material in bpy.data.materials if 'atd_key' in material)
+		material = bpy.data.materials.get(MATERIALS.get(key, ''))
+	if material is None:
+		material = bpy.data.materials.new(bitmap_path)
+		material['atd_key']    = key
+		material['atd_bitmap'] = bitmap_path # the material name gets a suffix when two matprops share a bitmap
+		MATERIALS[key] = material.name
+	return material
+
+@timed('buildrendergroup')
+def buildrendergroup(rendergroup, name, material):
+	"""The rendergroup's object, and a second one for the back faces of its two-sided faces if it has any"""
+	faces, backfaces, report = sanitizefaces(rendergroup.faces, len(rendergroup.positions))
+	count(**report)
+	work_objs = []
+	for work_name, work_faces in ((name, faces), (name + ' (two-sided)', backfaces)):
+		if work_objs and not len(work_faces): break
+		vertices = slice(None)
+		if work_objs: vertices, work_faces = renumbervertices(work_faces) # the back faces keep only the vertices they use
+		work_mesh = buildmesh(
+			work_name,
+			rendergroup.positions[vertices],
+			work_faces,
+			rendergroup.normals[vertices],
+			rendergroup.uvs[vertices, -1], # the last uv set
+		)
+		work_obj = bpy.data.objects.new(work_name, work_mesh)
+		work_obj.data.materials.append(material)
+		bpy.context.scene.objects.link(work_obj)
+		work_objs += [work_obj]
+	count(vertices = len(rendergroup.positions), faces = len(faces) + len(backfaces), objects = len(work_objs))
+	return work_objs
+
+def buildgeo1(model, obj_root, dl_roots = {}):
+	"""Build the decoded rendergroups of each detail level, into the given detail level empties or new ones"""
+	detaillevel_string = 'Detail level %%0%ii' % len(str(len(model.detaillevels)))
+	for detaillevel_id, detaillevel in enumerate(model.detaillevels):
+		dl_root = dl_roots.get(detaillevel_id)
+		if dl_root is None:
+			if all(rendergroup.positions is None for rendergroup in detaillevel.rendergroups): continue # created when loaded, an empty one would not export
+			bpy.ops.object.empty_add()
+			dl_root = bpy.context.scene.objects[0]
+			dl_root.name = detaillevel_string % detaillevel_id
+			dl_root.parent = obj_root
+			dl_root['atd_detaillevel'] = detaillevel_id
+		# detail level is split into submeshes as textures are applied per submesh
+		rendergroup_string = 'Rendergroup %%0%ii (Material %%0%ii)' % (len(str(len(detaillevel.rendergroups))), len(str(len(model.bitmaps))))
+		for rendergroup_id, rendergroup in enumerate(detaillevel.rendergroups):
+			if rendergroup.positions is None: continue # left on disk, see loadskipped
+			# texblend effect mask  , variable as 3, 9, 17, or 513 in effects models, else 0
+			# texblend effects      , 2 in effects models, else always 1
+			# texblend coordinates  , 2 in flow models, else always 1
+			# blends, 4 of:
+			# I effect         
+			# H textureindex    # the bitmap used on the rendergroup
+			# B coordinateindex
+			# B tilinginfo      # 0x3 = tiling enabled, 0 = disabled
+			for work_obj in buildrendergroup(
+				rendergroup,
+				rendergroup_string % (rendergroup_id, rendergroup.texture),
+				getmaterial(
+					model.bitmaps[rendergroup.texture].path,
+					model.matprops[rendergroup.material] if rendergroup.material < len(model.matprops) else None,
+				),
+			):
+				work_obj.parent = dl_root
+				work_obj['atd_rendergroup'] = rendergroup_id
+
+def loadskipped(obj_root):
+	"""Build what the import of a root left on disk into its existing hierarchy. Returns the number of rendergroups built"""
+	dl_roots = {child['atd_detaillevel']: child for child in obj_root.children if 'atd_detaillevel' in child}
+	skip = {
+		(detaillevel_id, child['atd_rendergroup'])
+		for detaillevel_id, dl_root in dl_roots.items()
+		for child in dl_root.children if 'atd_rendergroup' in child
+	}
+	model = parse(bpy.path.abspath(obj_root['atd_filepath']), skip = skip)
+	buildgeo1(model, obj_root, dl_roots)
+	return sum(rendergroup.positions is not None for detaillevel in model.detaillevels for rendergroup in detaillevel.rendergroups)
+
+@timed('open_mdl2')
+def open_mdl2(filepath, model = None, usebitmaps = True, usetext = True, detaillevels = None, bitmaps = None):
+	if model is None: model = parse(filepath, detaillevels, bitmaps)
 	fn = splitext(split(filepath)[1])[0]
 	bpy.ops.object.empty_add()
 	obj_root = bpy.context.scene.objects[0]
 	obj_root.name = fn
+	obj_root['atd_filepath'] = filepath
 	
 	if usetext:
 		text = bpy.data.texts.new(fn)
@@ -111,35 +256,23 @@ def open_mdl2(filepath, usebitmaps = True, usetext = True):
 			'# Keep this file named the same as your root to export with its settings.\n\n'
 		)
 	
-	chunk_name = f.read(4)
-	chunk_size = unpack('I', f.read(4))
-	head_inertiamulti   = unpack('3f', f.read(12))
-	head_boundingradius = unpack('f',  f.read(4))
-	(
-		head_distancefades , # boolean, 0 for map landmarks, 1 for small objects
-		head_hasboundingbox, # always 1
-	) = unpack('2I', f.read(8))
+	head = model.header
 	
 	if usetext: ###########################
 		text.write(
-			'InertiaTensor  = %.06f, %.06f, %.06f\n' % head_inertiamulti        +
-			'BoundingRadius = %.06f\n'               % head_boundingradius      +
-			'DistanceFades  = %s\n'                  % i2b(head_distancefades)  +
-			'HasBoundingBox = %s\n\n'                % i2b(head_hasboundingbox)
+			'InertiaTensor  = %.06f, %.06f, %.06f\n' % head.inertiamulti            +
+			'BoundingRadius = %.06f\n'               % head.boundingradius          +
+			'DistanceFades  = %s\n'                  % i2b(head.distancefades)      +
+			'HasBoundingBox = %s\n\n'                % i2b(bool(head.boundingbox))
 		)
 		
-	if head_hasboundingbox:
-		head_boundingboxmin    = unpack('3f', f.read(12))
-		head_boundingboxmax    = unpack('3f', f.read(12))
-		head_boundingboxcenter = unpack('3f', f.read(12))
-		head_boundingboxroty   = unpack('f',  f.read(4))
-	
+	if head.boundingbox:
 		if usetext: ##########################
 			text.write(
-				'BoundingBoxMin    = %.06f, %.06f, %.06f\n' % head_boundingboxmin    +
-				'BoundingBoxMax    = %.06f, %.06f, %.06f\n' % head_boundingboxmax    +
-				'BoundingBoxCenter = %.06f, %.06f, %.06f\n' % head_boundingboxcenter +
-				'BoundingBoxYaw    = %.06f\n\n'             % head_boundingboxroty
+				'BoundingBoxMin    = %.06f, %.06f, %.06f\n' % head.boundingbox[0:3] +
+				'BoundingBoxMax    = %.06f, %.06f, %.06f\n' % head.boundingbox[3:6] +
+				'BoundingBoxCenter = %.06f, %.06f, %.06f\n' % head.boundingbox[6:9] +
+				'BoundingBoxYaw    = %.06f\n\n'             % head.boundingbox[9]
 			)
 		
 	( # all these fields appear unused and always 0
@@ -147,7 +280,7 @@ def open_mdl2(filepath, usebitmaps = True, usetext = True):
 		head_useuniquetextures ,
 		head_usegenericgeometry,
 		head_vertexbufferflags ,
-	) = unpack('4I', f.read(16))
+	) = head.flags
 	
 	if usetext: ##########################
 		text.write(
@@ -158,434 +291,48 @@ def open_mdl2(filepath, usebitmaps = True, usetext = True):
 			'VertexBufferFlags  = %s\n\n' % i2x(head_vertexbufferflags )
 		)
 	
-	f.seek(48, 1)
-	head_bitmap_count = unpack('I', f.read(4))[0]
-	bitmaps = buildbitmaplist(f, head_bitmap_count)
-	materials = [bpy.data.materials.new(x[0]) for x in bitmaps]
+	bitmaps = buildbitmaplist(model)
 	
-	head_matprop_count = unpack('I', f.read(4))[0]
-	matprops = []
-	print('MatProps: %i' % head_matprop_count)
-	for matprop_id in range(head_matprop_count):
-		head_matprop_ambient  = unpack('4f', f.read(16))
-		head_matprop_diffuse  = unpack('4f', f.read(16))
-		head_matprop_specular = unpack('4f', f.read(16))
-		head_matprop_emissive = unpack('4f', f.read(16))
-		(
-			head_matprop_shine    ,
-			head_matprop_alpha    ,
-			head_matprop_alphatype,
-			head_matprop_bitfield ,
-		) = unpack('2f2I', f.read(16))
-		head_matprop_animname  = readnulltermstring(f.read(8))
-		
+	for matprop in model.matprops:
 		if usetext: ##########################
 			text.write(
 				'# Shaders\n'                                                                  +
-				'MatPropAmbient   = %.06f, %.06f, %.06f, %.06f\n' % head_matprop_ambient       +
-				'MatPropDiffuse   = %.06f, %.06f, %.06f, %.06f\n' % head_matprop_diffuse       +
-				'MatPropSpecular  = %.06f, %.06f, %.06f, %.06f\n' % head_matprop_specular      +
-				'MatPropEmissive  = %.06f, %.06f, %.06f, %.06f\n' % head_matprop_emissive      +
-				'MatPropShine     = %.06f\n'                      % head_matprop_shine         +
-				'MatPropAlpha     = %.06f\n'                      % head_matprop_alpha         +
-				'MatPropAlphaType = %i\n'                         % head_matprop_alphatype     +
-				'MatPropFlags     = %s\n'                         % i2x(head_matprop_bitfield) +
-				'MatPropName      = %s\n\n'                       % str(head_matprop_animname)
+				'MatPropAmbient   = %.06f, %.06f, %.06f, %.06f\n' % matprop.ambient       +
+				'MatPropDiffuse   = %.06f, %.06f, %.06f, %.06f\n' % matprop.diffuse       +
+				'MatPropSpecular  = %.06f, %.06f, %.06f, %.06f\n' % matprop.specular      +
+				'MatPropEmissive  = %.06f, %.06f, %.06f, %.06f\n' % matprop.emissive      +
+				'MatPropShine     = %.06f\n'                      % matprop.shine         +
+				'MatPropAlpha     = %.06f\n'                      % matprop.alpha         +
+				'MatPropAlphaType = %i\n'                         % matprop.alphatype     +
+				'MatPropFlags     = %s\n'                         % i2x(matprop.bitfield) +
+				'MatPropName      = %s\n\n'                       % str(matprop.animname)
 			)
-		
-		matprops += [(
-			head_matprop_ambient  ,
-			head_matprop_diffuse  ,
-			head_matprop_specular ,
-			head_matprop_emissive ,
-			head_matprop_shine    ,
-			head_matprop_alpha    ,
-			head_matprop_alphatype,
-			head_matprop_bitfield ,
-			head_matprop_animname ,
-		)]
 	
-	offset = f.tell()
-	while 1:
-		chunk_name = f.read(4)
-		if chunk_name == b'\0\0\0\0' or not len(chunk_name) == 4: break
-		chunk_size = unpack('I', f.read(4))[0]
-		
-		print('%s: %s' % (chunk_name.decode('ascii'), hex(chunk_size)))
-		
-		if chunk_name == b'GEO1':
-			geo1_detaillevels = unpack('I', f.read(4))[0]
-			
-			detaillevel_string = 'Detail level %%0%ii' % len(str(geo1_detaillevels))
-			for detaillevel_id in range(geo1_detaillevels):
-				bpy.ops.object.empty_add()
-				dl_root = bpy.context.scene.objects[0]
-				dl_root.name = detaillevel_string % detaillevel_id
-				dl_root.parent = obj_root
-				(
-					geo1_detaillevel_type         , # 0 for base mesh, 1 for distant mesh (model type distant)
-					geo1_detaillevel_maxedgelength, # unknown purpose, is the distance between the two most distant connected vertices
-					geo1_rendergroups             , # detail level is split into submeshes as textures are applied per submesh
-				) = unpack('IfI', f.read(12))
-				f.seek(8, 1)
-				rendergroup_string = 'Rendergroup %%0%ii (Material %%0%ii)' % (len(str(geo1_rendergroups)), len(str(len(bitmaps))))
-				for rendergroup_id in range(geo1_rendergroups):
-					work_bmesh = bmesh.new()
-					(
-						geo1_rendergroup_polygons, #
-						geo1_rendergroup_vertices, #
-						geo1_rendergroup_material, #
-						geo1_rendergroup_effects , # 512 in rgeffects models, else 0
-					) = unpack('4H', f.read(8))
-					f.seek(12, 1)
-					(
-						geo1_texblend_effectmask     , # variable as 3, 9, 17, or 513 in effects models, else 0
-						geo1_texblend_renderreference, # always 0
-						geo1_texblend_effects        , # 2 in effects models, else always 1
-						geo1_texblend_custom         , # always 0
-						geo1_texblend_coordinates    , # 2 in flow models, else always 1
-					) = unpack('3H2B', f.read(8))
-					geo1_texblend_blends = tuple(unpack('IH2B', f.read(8)) for x in range(4))
-					# I effect         
-					# H textureindex    # the bitmap used on the rendergroup
-					# B coordinateindex
-					# B tilinginfo      # 0x3 = tiling enabled, 0 = disabled
-					
-					(
-						geo1_vertex_offset_vector  , # always 0
-						geo1_vertex_offset_normal  , # always 12
-						geo1_vertex_offset_colour  , # variable (trash memory if not geo1_vertex_flags & VERTEX_HAS_COLOR)
-						geo1_vertex_offset_texcoord, # variable on account of previous int
-						geo1_vertex_size_vertstruct, # variable on account of previous ints
-						geo1_vertex_num_texcoords  , # either 1, or 2 (rare)
-						geo1_vertex_flags          , # see VERTEX_HAS_VECTOR and its following flags
-						geo1_vertex_vertices       , # identical to geo1_rendergroup_vertices
-						geo1_vertex_managedbuffer  , # always 1
-						geo1_vertex_currentvertex  , # either 15998, 16256, or 0
-					) = unpack('4I2I4H', f.read(32))
-					f.seek(8, 1)
-					
-					for vertex in range(geo1_vertex_vertices): work_bmesh.verts.new()
-					work_bmesh.verts.ensure_lookup_table()
-					
-					uvs = []
-					normals = []
-					for vertex in range(geo1_vertex_vertices):
-						vstruct = bio(f.read(geo1_vertex_size_vertstruct))
-						vertex_xyz    = unpack('3f', vstruct.read(12))[::-1]
-						vertex_normal = unpack('3f', vstruct.read(12))[::-1]
-						if geo1_vertex_flags & VERTEX_HAS_COLOR:
-							vertex_color = unpack('4f', vstruct.read(16))
-						for texcoord_id in range(geo1_vertex_num_texcoords):
-							vertex_uv     = unpack('2f', vstruct.read(8))
-						work_bmesh.verts[vertex].co = vertex_xyz
-						normals += [vertex_normal]
-						uvs += [vertex_uv]
-					(
-						geo1_fill_selectableprimblocks, # always 1
-						geo1_fill_type                , # always 0
-						geo1_fill_indices             , # always equal to (geo1_rendergroup_polygons*3)
-					) = unpack('3I', f.read(12))
-					
-					buildfaces(work_bmesh, geo1_fill_type, geo1_rendergroup_polygons, f)
-					
-					### uv
-					work_bmesh.faces.ensure_lookup_table()
-					work_bmesh.verts.index_update()
-					uv_layer = work_bmesh.loops.layers.uv.new()
-					for face in work_bmesh.faces:
-						for loop in face.loops: loop[uv_layer].uv = uvs[loop.vert.index]
-					### uv
-					
-					work_mesh = bpy.data.meshes.new(rendergroup_string % (rendergroup_id, geo1_texblend_blends[0][1]))
-					work_bmesh.to_mesh(work_mesh)
-					
-					#### normal test
-					work_mesh.normals_split_custom_set_from_vertices(normals)
-					work_mesh.use_auto_smooth = True
-					#### normal test
-					
-					work_obj = bpy.data.objects.new(rendergroup_string % (rendergroup_id, geo1_texblend_blends[0][1]), work_mesh)
-					work_obj.data.materials.append(materials[geo1_texblend_blends[0][1]])
-					work_obj.parent = dl_root
-					bpy.context.scene.objects.link(work_obj)
-		offset += 8 + chunk_size
-		f.seek(offset)
-	f.close()
+	buildgeo1(model, obj_root)
 	obj_root.rotation_euler = (__import__('math').pi / 2, 0, 0)
 	if usebitmaps: openbitmaps(filepath, bitmaps)
 			
-def open_mdl1(filepath, usebitmaps = True):
-	f = open(filepath,'rb')
+@timed('open_mdl1')
+def open_mdl1(filepath, model = None, usebitmaps = True, usetext = True, detaillevels = None, bitmaps = None): # no settings text for this version yet
+	if model is None: model = parse(filepath, detaillevels, bitmaps)
 	fn = splitext(split(filepath)[1])[0]
 	bpy.ops.object.empty_add()
 	obj_root = bpy.context.scene.objects[0]
 	obj_root.name = fn
+	obj_root['atd_filepath'] = filepath
 	
-	chunk_name = f.read(4)
-	chunk_size = unpack('I', f.read(4))
-	(
-		head_inertiamulti  , # variable
-		head_boundingradius, # variable
-		head_distancefades , # boolean, 0 for map landmarks, 1 for small objects
-		head_hasboundingbox, # always 1
-	) = unpack('3ff2I', f.read(24))
-	if head_hasboundingbox:
-		(
-			head_boundingboxmin   ,
-			head_boundingboxmax   ,
-			head_boundingboxcenter,
-			head_boundingboxroty  ,
-		) = unpack('3f3f3ff', f.read(40))
-	( # all these fields appear unused
-		head_useuniquematerials, # always 0
-		head_useuniquetextures , # always 0
-		head_usegenericgeometry, # always 0
-		head_vertexbufferflags , # always 0
-	) = unpack('4I', f.read(16))
-	f.seek(48, 1)
-	
-	head_bitmap_count = unpack('I', f.read(4))[0]
-	bitmaps = buildbitmaplist(f, head_bitmap_count)
-	materials = [bpy.data.materials.new(x[0]) for x in bitmaps]
+	bitmaps = buildbitmaplist(model)
 	
-	head_matprop_count = unpack('I', f.read(4))[0]
-	matprops = []
-	for matprop_id in range(head_matprop_count):
-		(
-			head_int0  ,
-			head_float0,
-			head_float1,
-			head_float2,
-			head_float3,
-			head_float4,
-			head_float5,
-		) = unpack('I6f', f.read(28))
-		matprops += [(
-			head_int0  ,
-			head_float0,
-			head_float1,
-			head_float2,
-			head_float3,
-			head_float4,
-			head_float5,
-		)]
-	
-	offset = f.tell()
-	while 1:
-		chunk_name = f.read(4)
-		if chunk_name == b'\0\0\0\0' or not len(chunk_name) == 4: break
-		chunk_size = unpack('I', f.read(4))[0]
-		
-		print('%s: %s' % (chunk_name.decode('ascii'), hex(chunk_size)))
-		
-		if chunk_name == b'GEO1':
-			#variable
-			geo1_detaillevels = unpack('I', f.read(4))[0]
-			
-			detaillevel_string = 'Detail level %%0%ii' % len(str(geo1_detaillevels))
-			for detaillevel_id in range(geo1_detaillevels):
-				bpy.ops.object.empty_add()
-				dl_root = bpy.context.scene.objects[0]
-				dl_root.name = detaillevel_string % detaillevel_id
-				dl_root.parent = obj_root
-				(
-					geo1_detaillevel_type         , # variable; 0 for base mesh, 1 for distant mesh (model type distant)
-					geo1_detaillevel_maxedgelength, # variable, unknown purpose, is the distance between the two most distant connected vertices
-					geo1_rendergroups             , # variable, detail level is split into submeshes as textures are applied per submesh
-				) = unpack('IfI', f.read(12))
-				f.seek(8, 1)
-				rendergroup_string = 'Rendergroup %%0%ii (Material %%0%ii)' % (len(str(geo1_rendergroups)), len(str(len(bitmaps))))
-				for rendergroup_id in range(geo1_rendergroups):
-					work_bmesh = bmesh.new()
-					(
-						geo1_rendergroup_polygons, # variable
-						geo1_rendergroup_vertices, # variable
-						geo1_rendergroup_material, # variable
-						geo1_rendergroup_effects , # 512 in rgeffects models, else 0
-					) = unpack('4H', f.read(8))
-					f.seek(12, 1)
-					(
-						geo1_texblend_effectmask     , # variable as 3, 9, 17, or 513 in effects models, else 0
-						geo1_texblend_renderreference, # always 0
-						geo1_texblend_effects        , # 2 in effects models, else always 1
-						geo1_texblend_custom         , # always 0
-						geo1_texblend_coordinates    , # 2 in flow models, else always 1
-					) = unpack('3H2B', f.read(8))
-					geo1_texblend_blends = tuple(unpack('IH2B', f.read(8)) for x in range(4))
-					# I effect         
-					# H textureindex    # the bitmap used on the rendergroup
-					# B coordinateindex
-					# B tilinginfo      # 0x3 = tiling enabled, 0 = disabled
-					
-					(
-						geo1_vertex_offset_vector  , # always 0
-						geo1_vertex_offset_normal  , # always 12
-						geo1_vertex_offset_colour  , # variable (trash memory if not geo1_vertex_flags & VERTEX_HAS_COLOR)
-						geo1_vertex_offset_texcoord, # variable on account of previous int
-						geo1_vertex_size_vertstruct, # variable on account of previous ints
-						geo1_vertex_num_texcoords  , # either 1, or 2 (rare)
-						geo1_vertex_flags          , # see VERTEX_HAS_VECTOR and its following flags
-						geo1_vertex_vertices       , # identical to geo1_rendergroup_vertices
-						geo1_vertex_managedbuffer  , # always 1
-						geo1_vertex_currentvertex  , # either 15998, 16256, or 0
-					) = unpack('4I2I4H', f.read(32))
-					f.seek(8, 1)
-					
-					for vertex in range(geo1_vertex_vertices): work_bmesh.verts.new()
-					work_bmesh.verts.ensure_lookup_table()
-					
-					uvs = []
-					normals = []
-					for vertex in range(geo1_vertex_vertices):
-						vstruct = bio(f.read(geo1_vertex_size_vertstruct))
-						vertex_xyz    = unpack('3f', vstruct.read(12))[::-1]
-						vertex_normal = unpack('3f', vstruct.read(12))[::-1]
-						if geo1_vertex_flags & VERTEX_HAS_COLOR:
-							vertex_color = unpack('4f', vstruct.read(16))
-						for texcoord_id in range(geo1_vertex_num_texcoords):
-							vertex_uv     = unpack('2f', vstruct.read(8))
-						work_bmesh.verts[vertex].co = vertex_xyz
-						normals += [vertex_normal]
-						uvs += [vertex_uv]
-					(
-						geo1_fill_selectableprimblocks, # always 1
-						geo1_fill_type                , # always 0
-						geo1_fill_indices             , # always equal to (geo1_rendergroup_polygons*3)
-					) = unpack('3I', f.read(12))
-					
-					buildfaces(work_bmesh, geo1_fill_type, geo1_rendergroup_polygons, f)
-					
-					### uv
-					work_bmesh.faces.ensure_lookup_table()
-					work_bmesh.verts.index_update()
-					uv_layer = work_bmesh.loops.layers.uv.new()
-					for face in work_bmesh.faces:
-						for loop in face.loops: loop[uv_layer].uv = uvs[loop.vert.index]
-					### uv
-					
-					work_mesh = bpy.data.meshes.new(rendergroup_string % (rendergroup_id, geo1_texblend_blends[0][1]))
-					work_bmesh.to_mesh(work_mesh)
-					
-					#### normal test
-					work_mesh.normals_split_custom_set_from_vertices(normals)
-					work_mesh.use_auto_smooth = True
-					#### normal test
-					
-					work_obj = bpy.data.objects.new(rendergroup_string % (rendergroup_id, geo1_texblend_blends[0][1]), work_mesh)
-					work_obj.data.materials.append(materials[geo1_texblend_blends[0][1]])
-					work_obj.parent = dl_root
-					bpy.context.scene.objects.link(work_obj)
-		offset += 8 + chunk_size
-		f.seek(offset)
-	f.close()
+	buildgeo1(model, obj_root)
 	obj_root.rotation_euler = (__import__('math').pi / 2, 0, 0)
 	if usebitmaps: openbitmaps(filepath, bitmaps)
 			
-def open_mdl0(filepath, usebitmaps = True):
-	f = open(filepath,'rb')
+@timed('open_mdl0')
+def open_mdl0(filepath, model = None, usebitmaps = True, usetext = True, detaillevels = None, bitmaps = None): # a single mesh, always decoded whole; no settings text for this version yet
+	if model is None: model = parse(filepath)
 	fn = splitext(split(filepath)[1])[0]
-	work_bmesh = bmesh.new()
-	(
-		mdl0_signature,
-		mdl0_int      ,
-		mdl0_int      ,
-		mdl0_int      ,
-		mdl0_float    ,
-		mdl0_bitmaps  ,
-	) = unpack('4s3IfI', f.read(24))
-	
-	for bitmap_id in range(mdl0_bitmaps):
-		bitmaps += [readnulltermstring(f.read(256)).decode('utf8')]
-	materials = [bpy.data.materials.new(x) for x in bitmaps]
-	
-	(
-		mdl0_int     ,
-		mdl0_int     ,
-		mdl0_int     ,
-		mdl0_int     ,
-		mdl0_int     ,
-		mdl0_int     ,
-		mdl0_int     ,
-		mdl0_int     ,
-		mdl0_float   ,
-		mdl0_int     ,
-		mdl0_int     ,
-		mdl0_int     ,
-		mdl0_polygons,
-		mdl0_vertices,
-		mdl0_int     ,
-		mdl0_int     ,
-		mdl0_int     ,
-		mdl0_int     ,
-	) = unpack('8If3I2H4I', f.read(68))
-	
-	(
-		mdl0_texblend_effectmask     ,
-		mdl0_texblend_renderreference,
-		mdl0_texblend_effects        ,
-		mdl0_texblend_custom         ,
-		mdl0_texblend_coordinates    ,
-	) = unpack('3H2B', f.read(8))
-	mdl0_texblend_blends = tuple(unpack('IH2B', f.read(8)) for x in range(4))
-	# I effect         
-	# H textureindex    # the bitmap used on the rendergroup
-	# B coordinateindex
-	# B tilinginfo      # 0x3 = tiling enabled, 0 = disabled
-	
-	(
-		mdl0_vertex_offset_vector  , # always 0
-		mdl0_vertex_offset_normal  , # always 12
-		mdl0_vertex_offset_colour  , # variable (trash memory if not geo1_vertex_flags & VERTEX_HAS_COLOR)
-		mdl0_vertex_offset_texcoord, # variable on account of previous int
-		mdl0_vertex_size_vertstruct, # variable on account of previous ints
-		mdl0_vertex_num_texcoords  , # either 1, or 2 (rare)
-		mdl0_vertex_flags          , # see VERTEX_HAS_VECTOR and its following flags
-		mdl0_vertex_vertices       , # identical to geo1_rendergroup_vertices
-		mdl0_vertex_managedbuffer  , # always 1
-		mdl0_vertex_currentvertex  , # either 15998, 16256, or 0
-	) = unpack('4I2I4H', f.read(32))
-	f.seek(8, 1)
-	
-	uvs = []
-	normals = []
-	for vertex in range(mdl0_vertices):
-		vstruct = bio(f.read(mdl0_vertex_size_vertstruct))
-		vertex_xyz    = unpack('3f', vstruct.read(12))[::-1]
-		vertex_normal = unpack('3f', vstruct.read(12))[::-1]
-		if mdl0_vertex_flags & VERTEX_HAS_COLOR:
-			vertex_color = unpack('4f', vstruct.read(16))
-		for texcoord_id in range(mdl0_vertex_num_texcoords):
-			vertex_uv     = unpack('2f', vstruct.read(8))
-		work_bmesh.verts.new(vertex_xyz)
-		normals += [vertex_normal]
-		uvs += [vertex_uv]
-	work_bmesh.verts.ensure_lookup_table()
-	work_bmesh.verts.index_update()
-	
-	mdl0_fill_type = unpack('I', f.read(4))[0]
-	
-	buildfaces(work_bmesh, mdl0_fill_type, mdl0_polygons, f)
-	
-	### uv
-	work_bmesh.faces.ensure_lookup_table()
-	uv_layer = work_bmesh.loops.layers.uv.new()
-	for face in work_bmesh.faces:
-		for loop in face.loops: loop[uv_layer].uv = uvs[loop.vert.index]
-	### uv
-	
-	work_mesh = bpy.data.meshes.new('MDL0 mesh')
-	work_bmesh.to_mesh(work_mesh)
-	
-	#### normal test
-	work_mesh.normals_split_custom_set_from_vertices(normals)
-	work_mesh.use_auto_smooth = True
-	#### normal test
-	
-	work_obj = bpy.data.objects.new(fn, work_mesh)
-	work_obj.data.materials.append(materials[0])
-	bpy.context.scene.objects.link(work_obj)
+	bitmaps = buildbitmaplist(model)
 	
-	f.close()
-	work_obj.rotation_euler = (__import__('math').pi / 2, 0, 0)
+	for work_obj in buildrendergroup(model.detaillevels[0].rendergroups[0], fn, getmaterial(model.bitmaps[0].path)):
+		work_obj.rotation_euler = (__import__('math').pi / 2, 0, 0)
 	if usebitmaps: openbitmaps(filepath, bitmaps)
\ No newline at end of file
@@ -0,0 +1,259 @@
+from collections import deque
+import numpy as np
+
+# Array operations on rendergroup geometry, free of bpy like read_atd.
+
+def uniquerows(keys):
+	"""First occurrence and inverse of each distinct row of a 2D array, numbered in order of first use"""
+	keys = np.ascontiguousarray(keys)
+	rows = keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+	unique, first, inverse = np.unique(rows, return_index = True, return_inverse = True)
+	order = np.argsort(first, kind = 'mergesort')
+	renumber = np.empty_like(order)
+	renumber[order] = np.arange(len(order))
+	return first[order], renumber[inverse.ravel()]
+
+def splitvertices(loop_vertex, loop_normal, loop_uv):
+	"""
+	One vertex per distinct (vertex, normal, uv) among the loops, so seams get a vertex for each side.
+	Returns the loop each new vertex is taken from, and the new vertex of every loop.
+	"""
+	keys = np.column_stack((
+		loop_vertex.astype(np.int32),
+		(loop_normal.astype(np.float32) + 0.).view(np.int32), # + 0. folds -0. into 0.
+		(loop_uv    .astype(np.float32) + 0.).view(np.int32),
+	))
+	return uniquerows(keys)
+
+def stripify(faces):
+	"""
+	Greedy triangle strips over the shared edges of the faces, joined into one strip by degenerate triangles.
+	Winding is kept, so decoding the strip and dropping its degenerates gives back every face.
+	"""
+	edges = {} # directed edge: face, along the face's winding
+	for face, (a, b, c) in enumerate(faces.tolist()):
+		edges[a, b] = edges[b, c] = edges[c, a] = face
+	corners = faces.tolist()
+	used  = bytearray(len(corners))
+	
+	def extend(a, b, c): # faces of the run from the triangle (a, b, c), without marking them used
+		run, taken = [a, b, c], set()
+		while 1: # an even triangle is wound as (p, q, next), an odd one as (q, p, next)
+			p, q = run[-2:]
+			face = edges.get((q, p) if len(run) % 2 else (p, q)) # len(run) - 2 is the index of the next triangle
+			if face is None or used[face] or face in taken: return run, taken
+			taken.add(face)
+			run += [next(v for v in corners[face] if v != p and v != q)]
+	
+	strip = []
+	for start in range(len(corners)):
+		if used[start]: continue
+		used[start] = 1
+		a, b, c = corners[start]
+		run, taken = max((extend(a, b, c), extend(b, c, a), extend(c, a, b)), key = lambda x: len(x[1])) # the longest of its 3 rotations
+		for face in taken: used[face] = 1
+		if strip:
+			strip += [strip[-1]] * (1 + len(strip) % 2) + [run[0]] # the run has to start on an even triangle
+		strip += run
+	return np.array(strip, np.uint16)
+
+def acmr(faces, cache_size = 16):
+	"""Average cache miss ratio, vertices transformed per face with a FIFO post-transform cache"""
+	cache, misses = deque(maxlen = cache_size), 0
+	for vertex in faces.ravel().tolist():
+		if vertex not in cache:
+			cache.append(vertex)
+			misses += 1
+	return misses / max(len(faces), 1)
+
+def optimizefaces(faces, cache_size = 32):
+	"""Face order for post-transform vertex cache reuse, after Tom Forsyth's linear-speed vertex cache optimisation"""
+	corners = faces.tolist()
+	vertex_faces = [[] for vertex in range(int(faces.max()) + 1 if len(faces) else 0)]
+	for face, corner in enumerate(corners):
+		for vertex in corner: vertex_faces[vertex] += [face]
+	position = [-1] * len(vertex_faces) # in the modelled LRU cache
+	
+	def vertexscore(vertex):
+		if not vertex_faces[vertex]: return -1.
+		p = position[vertex]
+		score = 0. if p < 0 else .75 if p < 3 else (1. - (p - 3) / (cache_size - 3)) ** 1.5 # the last face's vertices score alike
+		return score + 2. * len(vertex_faces[vertex]) ** -.5 # favour vertices with few faces left, to finish them off
+	
+	scores = [vertexscore(vertex) for vertex in range(len(vertex_faces))]
+	added  = bytearray(len(corners))
+	order, cache, cursor = [], [], 0
+	best = max(range(len(corners)), key = lambda face: sum(scores[v] for v in corners[face])) if corners else None
+	while best is not None:
+		added[best] = 1
+		order += [best]
+		for vertex in corners[best]:
+			vertex_faces[vertex].remove(best)
+			if vertex in cache: cache.remove(vertex)
+			cache.insert(0, vertex)
+		for vertex in cache[cache_size:]: position[vertex] = -1
+		for vertex in cache[cache_size:]: scores[vertex] = vertexscore(vertex)
+		del cache[cache_size:]
+		for p, vertex in enumerate(cache):
+			position[vertex] = p
+			scores[vertex] = vertexscore(vertex)
+		best, best_score = None, -1.
+		for vertex in cache:
+			for face in vertex_faces[vertex]:
+				score = sum(scores[v] for v in corners[face])
+				if score > best_score: best, best_score = face, score
+		if best is None: # nothing left around the cache, carry on from the first face not added yet
+			while cursor < len(corners) and added[cursor]: cursor += 1
+			best = cursor if cursor < len(corners) else None
+	return faces[order]
+
+def renumbervertices(faces):
+	"""Vertices in order of first use by the faces, and the faces renumbered to match; unused vertices are dropped"""
+	first, inverse = uniquerows(faces.reshape(-1, 1))
+	return faces.ravel()[first], inverse.reshape(faces.shape)
+
+def weldvertices(positions, normals, uvs, faces, epsilon):
+	"""
+	Merge the vertices whose position, normal and uv all round to the same multiples of epsilon.
+	Returns the vertex kept for each merged one, and the faces renumbered to match, without those that collapsed.
+	"""
+	keys = np.floor(np.column_stack((positions, normals, uvs)) / epsilon + .5).astype(np.int64)
+	first, inverse = uniquerows(keys)
+	faces = inverse[faces]
+	return first, faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])]
+
+def sanitizefaces(faces, vertex_count):
+	"""
+	Sort out the faces that cannot be built as one single-sided mesh, all at once instead of face by face.
+	Faces with an index out of range, a repeated index, or the same corners and winding as an earlier face are dropped;
+	faces with the same corners as an earlier face but wound the other way are the back faces of two-sided pairs.
+	Returns the clean faces, the back faces, and the count of each problem.
+	"""
+	faces      = np.asarray(faces).reshape(-1, 3)
+	inrange    = (faces < vertex_count).all(1)
+	degenerate = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 2] == faces[:, 0])
+	valid      = faces[inrange & ~degenerate]
+	lowest     = valid.argmin(1)
+	rows       = np.arange(len(valid))
+	flipped    = valid[rows, (lowest + 1) % 3] > valid[rows, (lowest + 2) % 3] # winding, independent of the starting corner
+	corners    = np.sort(valid, 1)
+	first, inverse = uniquerows(np.column_stack((corners, flipped)))
+	unique     = valid[first]
+	pair_first, pair_inverse = uniquerows(corners[first])
+	back       = np.arange(len(unique)) != pair_first[pair_inverse]
+	return unique[~back], unique[back], {
+		'out_of_range': int((~inrange).sum()),
+		'degenerate'  : int((inrange & degenerate).sum()),
+		'duplicate'   : len(valid) - len(unique),
+		'two_sided'   : int(back.sum()),
+	}
+
+def maxedgelength(positions, faces):
+	"""The length of the longest edge of the faces"""
+	if not len(faces): return 0.
+	edges = positions[faces] - positions[np.roll(faces, 1, 1)]
+	return float(np.sqrt((edges ** 2).sum(2).max()))
+
+def bounds(positions, yaw_steps = 0):
+	"""
+	Box and sphere around the positions, given in file order (z, y, x), as (min, max, center, yaw, radius).
+	With yaw_steps, that many yaws over a quarter turn about y are tried, and the box is the one of least volume,
+	its min and max along its own turned axes and its center back in model space; else the box is aligned to the axes.
+	"""
+	positions = np.asarray(positions, np.float64)
+	yaw, low, high = 0., positions.min(0), positions.max(0)
+	if yaw_steps and len(positions):
+		yaws = np.linspace(0, np.pi / 2, yaw_steps, endpoint = False)
+		cos, sin = np.cos(yaws), np.sin(yaws)
+		a = np.outer(positions[:, 0], cos) - np.outer(positions[:, 2], sin) # every position turned by every yaw, about y
+		b = np.outer(positions[:, 0], sin) + np.outer(positions[:, 2], cos)
+		areas = (a.max(0) - a.min(0)) * (b.max(0) - b.min(0)) # the extent along y does not change with yaw
+		best = int(areas.argmin())
+		yaw = float(yaws[best])
+		low  = np.array((a[:, best].min(), low[1],  b[:, best].min()))
+		high = np.array((a[:, best].max(), high[1], b[:, best].max()))
+	middle = (low + high) / 2
+	center = np.array((
+		middle[0] * np.cos(yaw) + middle[2] * np.sin(yaw),
+		middle[1],
+		-middle[0] * np.sin(yaw) + middle[2] * np.cos(yaw),
+	))
+	radius = float(np.sqrt(((positions - center) ** 2).sum(1).max())) if len(positions) else 0.
+	return tuple(low), tuple(high), tuple(center), yaw, radius
+
+def mergemeshes(meshes):
+	"""One mesh of the positions, normals, uvs and faces of several, the faces of each renumbered after the vertices before it"""
+	if len(meshes) == 1: return meshes[0]
+	offsets = np.cumsum([0] + [len(mesh[0]) for mesh in meshes[:-1]])
+	return (
+		np.concatenate([mesh[0] for mesh in meshes]),
+		np.concatenate([mesh[1] for mesh in meshes]),
+		np.concatenate([mesh[2] for mesh in meshes]),
+		np.concatenate([mesh[3] + offset for mesh, offset in zip(meshes, offsets)]),
+	)
+
+def splitfaces(positions, faces, max_vertices = 0xFFFF, max_faces = 0xFFFF):
+	"""
+	Cut faces into parts of at most max_vertices vertices and max_faces faces, halving them at the median face centre along the longest side
+	of their bounds, so every part is a compact piece and few vertices are repeated along the cuts. Returns the vertices and faces of every part,
+	renumbered as renumbervertices does, or all vertices and the faces as they are when they fit.
+	"""
+	if len(faces) <= max_faces and len(positions) <= max_vertices: return [(np.arange(len(positions)), faces)]
+	centres = positions[faces].mean(1)
+	pending, parts = [np.arange(len(faces))], []
+	while pending:
+		chosen = pending.pop()
+		vertices, part = renumbervertices(faces[chosen])
+		if len(chosen) <= max_faces and len(vertices) <= max_vertices:
+			parts += [(vertices, part)]
+			continue
+		axis  = np.ptp(centres[chosen], 0).argmax()
+		order = chosen[np.argsort(centres[chosen, axis], kind = 'mergesort')]
+		pending += [np.sort(order[len(order) // 2:]), np.sort(order[:len(order) // 2])] # the faces of a part keep their order
+	return parts
+
+def facenormals(positions, faces):
+	corners = positions[faces]
+	return np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+
+def decimate(positions, normals, uvs, faces, ratio):
+	"""
+	Collapse the shortest edges, in passes of edges that share no vertex, until about ratio of the faces are left.
+	Vertices on open edges never move, so uv seams, which are split into separate vertices, and the borders of a rendergroup keep their shape;
+	a pass drops the collapses that would turn a face over. Returns the positions, normals, uvs and faces left, with unused vertices dropped.
+	"""
+	target = int(len(faces) * ratio)
+	faces  = np.asarray(faces, np.int64)
+	while len(faces) > target:
+		edges = np.sort(np.concatenate((faces[:, :2], faces[:, 1:], faces[:, ::2])), 1)
+		first, inverse = uniquerows(edges)
+		edges = edges[first]
+		open_vertices = np.zeros(len(positions), bool)
+		open_vertices[edges[np.bincount(inverse, minlength = len(edges)) == 1].ravel()] = True
+		movable = ~open_vertices[edges].all(1)
+		edges = edges[movable]
+		edges[open_vertices[edges[:, 0]]] = edges[open_vertices[edges[:, 0]], ::-1] # the first vertex moves onto the second
+		lengths = ((positions[edges[:, 0]] - positions[edges[:, 1]]) ** 2).sum(1)
+		budget  = (len(faces) - target + 1) // 2 # a collapse takes about 2 faces with it
+		touched, moves = bytearray(len(positions)), []
+		for u, v in edges[np.argsort(lengths, kind = 'mergesort')].tolist():
+			if touched[u] or touched[v]: continue
+			touched[u] = touched[v] = 1
+			moves += [(u, v)]
+			if len(moves) >= budget: break
+		if not moves: break
+		moves = np.array(moves)
+		remap = np.arange(len(positions))
+		remap[moves[:, 0]] = moves[:, 1]
+		collapsed = remap[faces]
+		degenerate = (collapsed[:, 0] == collapsed[:, 1]) | (collapsed[:, 1] == collapsed[:, 2]) | (collapsed[:, 2] == collapsed[:, 0])
+		flipped = ~degenerate & ((facenormals(positions, faces) * facenormals(positions, collapsed)).sum(1) <= 0)
+		if flipped.any():
+			refused = faces[flipped].ravel()
+			remap[refused] = refused
+			if (remap == np.arange(len(positions))).all(): break
+			collapsed = remap[faces]
+			degenerate = (collapsed[:, 0] == collapsed[:, 1]) | (collapsed[:, 1] == collapsed[:, 2]) | (collapsed[:, 2] == collapsed[:, 0])
+		faces = collapsed[~degenerate]
+	order, faces = renumbervertices(faces)
+	return positions[order], normals[order], uvs[order], faces
\ No newline at end of file
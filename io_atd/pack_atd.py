@@ -0,0 +1,143 @@
+from os       import replace, remove, fdopen, chmod, stat, umask
+from os.path  import dirname, abspath
+from tempfile import mkstemp
+import numpy as np
+
+from .read_atd import (
+	CHUNK       ,
+	MDL_HEAD    ,
+	BOUNDINGBOX ,
+	MDL_FLAGS   ,
+	COUNT       ,
+	BITMAP      ,
+	MATPROP_MDL2,
+	MATPROP_MDL1,
+	MDL0_HEAD   ,
+	MDL0_GEOM   ,
+	DETAILLEVEL ,
+	RENDERGROUP ,
+	FILL        ,
+)
+
+# .MD2 serializer, free of bpy. The size of every section is known before anything is packed,
+# so a model is built in one preallocated buffer and written with a single call.
+
+def rendergroupsize(vertices, indices):
+	return RENDERGROUP.size + vertices.nbytes + FILL.size + indices.size * 2
+
+MATPROP = {b'MDL2': MATPROP_MDL2, b'MDL1': MATPROP_MDL1}
+
+def mdl2size(boundingbox, bitmaps, matprops, signature = b'MDL2'):
+	return (
+		MDL_HEAD.size
+		+ (BOUNDINGBOX.size if boundingbox else 0)
+		+ MDL_FLAGS.size
+		+ COUNT.size + BITMAP.size * len(bitmaps)
+		+ COUNT.size + MATPROP[signature].size * len(matprops)
+	)
+
+def geo1size(detaillevels):
+	return COUNT.size + sum(
+		DETAILLEVEL.size + sum(rendergroupsize(rendergroup[1], rendergroup[3]) for rendergroup in rendergroups)
+		for detaillevel_type, maxedgelength, rendergroups in detaillevels
+	)
+
+def packrendergroup(buffer, offset, header, vertices, fill_type, indices):
+	"""header holds the RENDERGROUP fields, vertices is a (vertices, floats per vertex) array in file order"""
+	assert header[0] <= 0xFFFF and header[1] <= 0xFFFF, 'A render group has %i polygons and %i vertices; it can have at most 65535 of each.' % header[:2]
+	RENDERGROUP.pack_into(buffer, offset, *header)
+	offset += RENDERGROUP.size
+	np.ndarray(vertices.shape, '<f4', buffer, offset)[...] = vertices
+	offset += vertices.nbytes
+	FILL.pack_into(buffer, offset, 1, fill_type, indices.size)
+	offset += FILL.size
+	np.ndarray(indices.size, '<u2', buffer, offset)[...] = indices.ravel()
+	return offset + indices.size * 2
+
+def packmdl2(inertiamulti, boundingradius, distancefades, boundingbox, flags, bitmaps, matprops, detaillevels, signature = b'MDL2'):
+	"""
+	boundingbox : None, or min, max, center and rotation y as 10 floats
+	bitmaps     : (path, type, index)
+	matprops    : MATPROP_MDL2 fields, or MATPROP_MDL1 fields for an MDL1 signature
+	detaillevels: (type, max edge length, [(header, vertices, fill type, indices)])
+	"""
+	mdl2_size = mdl2size(boundingbox, bitmaps, matprops, signature)
+	geo1_size = geo1size(detaillevels)
+	buffer = bytearray(CHUNK.size + mdl2_size + CHUNK.size + geo1_size)
+	
+	CHUNK.pack_into(buffer, 0, signature, mdl2_size)
+	offset = CHUNK.size
+	MDL_HEAD.pack_into(buffer, offset, *inertiamulti, boundingradius, distancefades, bool(boundingbox))
+	offset += MDL_HEAD.size
+	if boundingbox:
+		BOUNDINGBOX.pack_into(buffer, offset, *boundingbox)
+		offset += BOUNDINGBOX.size
+	MDL_FLAGS.pack_into(buffer, offset, *flags)
+	offset += MDL_FLAGS.size
+	COUNT.pack_into(buffer, offset, len(bitmaps))
+	offset += COUNT.size
+	for path, bitmap_type, index in bitmaps:
+		encodedpath = path.encode('ascii')
+		assert len(encodedpath) <= 255, 'The bitmap path "%s" is too long; it must be below 256 characters.' % path
+		BITMAP.pack_into(buffer, offset, encodedpath, bitmap_type, index)
+		offset += BITMAP.size
+	COUNT.pack_into(buffer, offset, len(matprops))
+	offset += COUNT.size
+	for matprop in matprops:
+		MATPROP[signature].pack_into(buffer, offset, *matprop)
+		offset += MATPROP[signature].size
+	
+	CHUNK.pack_into(buffer, offset, b'GEO1', geo1_size)
+	offset += CHUNK.size
+	COUNT.pack_into(buffer, offset, len(detaillevels))
+	offset += COUNT.size
+	for detaillevel_type, maxedgelength, rendergroups in detaillevels:
+		DETAILLEVEL.pack_into(buffer, offset, detaillevel_type, maxedgelength, len(rendergroups))
+		offset += DETAILLEVEL.size
+		for rendergroup in rendergroups:
+			offset = packrendergroup(buffer, offset, *rendergroup)
+	assert offset == len(buffer), 'Packed %i bytes into a buffer of %i.' % (offset, len(buffer))
+	return buffer
+
+def packmdl0(bitmaps, header, vertices, fill_type, indices):
+	"""An MDL0 has no chunks, only its bitmap paths and a single rendergroup; the fields before its rendergroup header are left 0"""
+	buffer = bytearray(
+		MDL0_HEAD.size + 256 * len(bitmaps) + MDL0_GEOM.size - 20
+		+ RENDERGROUP.size + vertices.nbytes + COUNT.size + indices.size * 2
+	)
+	MDL0_HEAD.pack_into(buffer, 0, b'MDL0', 0, 0, 0, 0., len(bitmaps))
+	offset = MDL0_HEAD.size
+	for path in bitmaps:
+		encodedpath = path.encode('ascii')
+		assert len(encodedpath) <= 255, 'The bitmap path "%s" is too long; it must be below 256 characters.' % path
+		buffer[offset:offset + len(encodedpath)] = encodedpath
+		offset += 256
+	offset += MDL0_GEOM.size - 20 # the polygon count onwards is laid out as a GEO1 rendergroup header
+	RENDERGROUP.pack_into(buffer, offset, *header)
+	offset += RENDERGROUP.size
+	np.ndarray(vertices.shape, '<f4', buffer, offset)[...] = vertices
+	offset += vertices.nbytes
+	COUNT.pack_into(buffer, offset, fill_type)
+	offset += COUNT.size
+	np.ndarray(indices.size, '<u2', buffer, offset)[...] = indices.ravel()
+	assert offset + indices.size * 2 == len(buffer), 'Packed %i bytes into a buffer of %i.' % (offset + indices.size * 2, len(buffer))
+	return buffer
+
+def filemode(filepath):
+	"""Permissions of an existing file, or those a new one would be created with"""
+	try: return stat(filepath).st_mode & 0o777
+	except FileNotFoundError:
+		mask = umask(0)
+		umask(mask)
+		return 0o666 & ~mask
+
+def writeatomic(filepath, data):
+	"""Write through a temporary file next to filepath, so an existing file is only ever replaced whole"""
+	handle, temppath = mkstemp(suffix = '.tmp', dir = dirname(abspath(filepath)))
+	try:
+		with fdopen(handle, 'wb') as f: f.write(data)
+		chmod(temppath, filemode(filepath)) # mkstemp makes it readable by the owner only
+		replace(temppath, filepath)
+	except:
+		remove(temppath)
+		raise
\ No newline at end of file
@@ -0,0 +1,254 @@
+from multiprocessing import get_context
+from functools       import partial
+import numpy as np
+
+from .stats_atd import timed, count
+from .read_atd import (
+	MD2Reader  ,
+	MDL_HEAD   ,
+	BOUNDINGBOX,
+	MDL_FLAGS  ,
+	RG_MATERIAL,
+	RG_EFFECTS ,
+	RG_TEXBLEND,
+	RG_BLENDS  ,
+	RG_VERTEX  ,
+	swizzle    ,
+	buildfaces ,
+)
+
+# Headless .MD2 parser. A whole file is decoded into a compact model, plain records for the header and tables,
+# and NumPy arrays for the geometry, which the Blender importer and the command line tools all build on.
+
+ARRAYS = ('positions', 'normals', 'colours', 'uvs', 'faces')
+ALIGN  = 16
+
+class Record:
+	__slots__ = ()
+	def __init__(self, *values):
+		for name, value in zip(self.__slots__, values): setattr(self, name, value)
+	def __iter__(self):
+		return (getattr(self, name) for name in self.__slots__)
+	def __repr__(self):
+		return '%s(%s)' % (type(self).__name__, ', '.join('%s=%r' % (name, getattr(self, name)) for name in self.__slots__))
+
+class Header(Record):
+	__slots__ = (
+		'signature'     , # b'MDL2', b'MDL1' or b'MDL0'
+		'inertiamulti'  ,
+		'boundingradius',
+		'distancefades' , # boolean, 0 for map landmarks, 1 for small objects
+		'boundingbox'   , # None, or min, max, center and rotation y as 10 floats
+		'flags'         , # unique materials, unique textures, generic geometry, vertex buffer flags; all appear unused and 0
+	)
+
+class Bitmap(Record):
+	__slots__ = ('path', 'type', 'index')
+
+class MatProp(Record):
+	__slots__ = ('ambient', 'diffuse', 'specular', 'emissive', 'shine', 'alpha', 'alphatype', 'bitfield', 'animname')
+
+class Rendergroup(Record):
+	__slots__ = (
+		'material'    ,
+		'effects'     , # 512 in rgeffects models, else 0
+		'texblend'    , # effect mask, render reference, effects, custom, coordinates
+		'blends'      , # 4 of (effect, texture index, coordinate index, tiling info)
+		'vertexformat', # the GEO1 vertex fields, offsets to flags
+		'fill_type'   ,
+		'positions'   , # (vertices, 3) float32, swizzled to Blender's axis order
+		'normals'     , # (vertices, 3) float32, swizzled
+		'colours'     , # (vertices, 4) float32, or None
+		'uvs'         , # (vertices, uv sets, 2) float32
+		'faces'       , # (polygons, 3) uint16
+	)
+	@property
+	def texture(self): return self.blends[0][1] # the bitmap used on the rendergroup
+
+class DetailLevel(Record):
+	__slots__ = (
+		'type'         , # 1 for base mesh, 2 for distant mesh (model type distant)
+		'maxedgelength', # the distance between the two most distant connected vertices
+		'rendergroups' ,
+	)
+
+class Model(Record):
+	__slots__ = ('filepath', 'header', 'bitmaps', 'matprops', 'detaillevels', 'chunks')
+
+def parseheader(reader):
+	if reader.signature == b'MDL0': return Header(reader.signature, (0., 0., 0.), 0., 0, None, (0, 0, 0, 0))
+	head = MDL_HEAD.unpack_from(reader.map, reader.header)
+	offset = reader.header + MDL_HEAD.size
+	boundingbox = None
+	if head[5]:
+		boundingbox = BOUNDINGBOX.unpack_from(reader.map, reader.boundingbox)
+		offset += BOUNDINGBOX.size
+	return Header(reader.signature, head[0:3], head[3], head[4], boundingbox, MDL_FLAGS.unpack_from(reader.map, offset))
+
+def parserendergroup(reader, entry, geometry = True):
+	header   = reader.readheader(entry)
+	blends   = header[RG_BLENDS]
+	if geometry: vertices = reader.readvertices(entry)
+	return Rendergroup(
+		header[RG_MATERIAL],
+		header[RG_EFFECTS],
+		header[RG_TEXBLEND],
+		tuple(blends[x:x + 4] for x in range(0, 16, 4)),
+		header[RG_VERTEX],
+		entry.fill_type,
+		*(
+			np.ascontiguousarray(swizzle(vertices['vector'])),
+			np.ascontiguousarray(swizzle(vertices['normal'])),
+			vertices['colour'].copy() if 'colour' in vertices.dtype.names else None,
+			vertices['texcoord'].copy(),
+			buildfaces(entry.fill_type, entry.polygons, reader.readindices(entry)).astype(np.uint16),
+		) if geometry else (None,)*5, # left on disk
+	)
+
+def selected(reader, detaillevel_id, rendergroup_id, entry, detaillevels, bitmaps, skip):
+	if detaillevels is not None and detaillevel_id not in detaillevels: return False
+	if (detaillevel_id, rendergroup_id) in skip: return False
+	if bitmaps is None: return True
+	texture = reader.readheader(entry)[RG_BLENDS][1]
+	return texture < len(reader.bitmaps) and any(part.lower() in reader.bitmaps[texture][0].lower() for part in bitmaps)
+
+@timed('parse')
+def parse(filepath, detaillevels = None, bitmaps = None, skip = ()):
+	"""
+	Decode a whole .MD2 file into a Model. Rendergroups can be left on disk, keeping their header fields but no geometry:
+	detaillevels: indices of the detail levels to decode, all if None
+	bitmaps     : parts of bitmap paths, to decode only the rendergroups using a matching bitmap, all if None
+	skip        : (detail level index, rendergroup index) pairs not to decode
+	"""
+	with MD2Reader(filepath) as reader:
+		count(bytes = reader.size)
+		return Model(
+			filepath,
+			parseheader(reader),
+			[Bitmap(*bitmap) for bitmap in reader.bitmaps],
+			[MatProp(*matprop) if len(matprop) == 9 else matprop for matprop in reader.matprops], # MDL1 matprops are an int and 6 floats of unknown meaning
+			[
+				DetailLevel(detaillevel.type, detaillevel.maxedgelength, [
+					parserendergroup(reader, entry, selected(reader, detaillevel_id, rendergroup_id, entry, detaillevels, bitmaps, skip))
+					for rendergroup_id, entry in enumerate(entries)
+				])
+				for detaillevel_id, (detaillevel, entries) in enumerate(reader.detaillevels)
+			],
+			reader.chunks,
+		)
+
+def rendergroupmetadata(reader, entry):
+	header = reader.readheader(entry)
+	return {
+		'polygons' : entry.polygons,
+		'vertices' : entry.vertex_count,
+		'indices'  : entry.index_count,
+		'fill_type': entry.fill_type,
+		'texture'  : header[RG_BLENDS][1],
+		'effects'  : header[RG_EFFECTS],
+	}
+
+def metadata(filepath):
+	"""
+	Header, bitmaps, matprops and per-rendergroup counts of a .MD2 as a dict of plain values that JSON can hold.
+	Only the headers are read, the reader steps over the vertex and index blocks.
+	"""
+	with MD2Reader(filepath) as reader:
+		header = parseheader(reader)
+		return {
+			'filepath'      : filepath,
+			'size'          : reader.size,
+			'signature'     : header.signature.decode('ascii', 'replace'),
+			'inertiamulti'  : header.inertiamulti,
+			'boundingradius': header.boundingradius,
+			'distancefades' : header.distancefades,
+			'boundingbox'   : header.boundingbox,
+			'flags'         : header.flags,
+			'chunks'        : [(chunk.name.decode('ascii', 'replace'), chunk.size) for chunk in reader.chunks],
+			'bitmaps'       : [bitmap[0] for bitmap in reader.bitmaps],
+			'matprops'      : [[value.decode('ascii', 'replace').rstrip('\0') if isinstance(value, bytes) else value for value in matprop] for matprop in reader.matprops],
+			'detaillevels'  : [
+				{
+					'type'         : detaillevel.type,
+					'maxedgelength': detaillevel.maxedgelength,
+					'rendergroups' : [rendergroupmetadata(reader, entry) for entry in entries],
+				}
+				for detaillevel, entries in reader.detaillevels
+			],
+		}
+
+def share(model):
+	"""Move the geometry of a model into one shared memory block, leaving (offset, dtype, shape) in place of each array"""
+	rendergroups = [rendergroup for detaillevel in model.detaillevels for rendergroup in detaillevel.rendergroups]
+	size = sum(-(-getattr(rendergroup, name).nbytes // ALIGN) * ALIGN for rendergroup in rendergroups for name in ARRAYS if getattr(rendergroup, name) is not None)
+	from multiprocessing.shared_memory import SharedMemory
+	block = SharedMemory(create = True, size = max(size, 1))
+	offset = 0
+	for rendergroup in rendergroups:
+		for name in ARRAYS:
+			array = getattr(rendergroup, name)
+			if array is None: continue
+			np.ndarray(array.shape, array.dtype, block.buf, offset)[...] = array
+			setattr(rendergroup, name, (offset, array.dtype.str, array.shape))
+			offset += -(-array.nbytes // ALIGN) * ALIGN
+	block.close() # the parent attaches and unlinks it
+	return block.name
+
+def attach(model, block):
+	"""Copy the geometry of a shared model out of its block, which can then be unlinked while the arrays live on"""
+	for detaillevel in model.detaillevels:
+		for rendergroup in detaillevel.rendergroups:
+			for name in ARRAYS:
+				location = getattr(rendergroup, name)
+				if location is None: continue
+				offset, dtype, shape = location
+				setattr(rendergroup, name, np.ndarray(shape, dtype, block.buf, offset).copy())
+
+def parseone(filepath, select):
+	try: return filepath, parse(filepath, **select), None
+	except Exception as error: return filepath, None, error
+
+def parseshared(filepath, select):
+	filepath, model, error = parseone(filepath, select)
+	if error is not None: return filepath, None, None, error
+	try: return filepath, model, share(model), None
+	except Exception as error: return filepath, None, None, error
+
+def parsemany(filepaths, jobs = None, **select):
+	"""
+	Parse files in a process pool, yielding (filepath, model, error) in the given order; select is passed on to parse.
+	The geometry comes back through shared memory from Python 3.8 on, else pickled. Without fork, as on Windows, the files are parsed
+	here one after another, since spawned workers would import the addon and bpy.
+	"""
+	try: context = get_context('fork')
+	except ValueError:
+		for filepath in filepaths: yield parseone(filepath, select)
+		return
+	try:
+		from multiprocessing.shared_memory import SharedMemory
+		from multiprocessing import resource_tracker
+	except ImportError:
+		with context.Pool(jobs) as pool:
+			yield from pool.imap(partial(parseone, select = select), filepaths)
+		return
+	resource_tracker.ensure_running() # shared by the workers, so the blocks they create are forgotten once unlinked here
+	with context.Pool(jobs) as pool:
+		results = [pool.apply_async(parseshared, (filepath, select)) for filepath in filepaths]
+		try:
+			while results:
+				filepath, model, name, error = results[0].get()
+				results.pop(0)
+				if name is not None:
+					block = SharedMemory(name)
+					try: attach(model, block)
+					finally:
+						block.close()
+						block.unlink()
+				yield filepath, model, error
+		finally:
+			for result in results: # left over when the caller stopped early
+				name = result.get()[2]
+				if name is None: continue
+				block = SharedMemory(name)
+				block.close()
+				block.unlink()
\ No newline at end of file
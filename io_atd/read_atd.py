@@ -0,0 +1,227 @@
+from mmap        import mmap, ACCESS_READ
+from struct      import Struct
+from collections import namedtuple
+from os          import fstat
+import numpy as np
+
+from .stats_atd import timed, count
+
+# Memory-mapped .MD2 reader, free of bpy so the command line tools can use it too.
+# The whole file is mapped once and every chunk, detail level and rendergroup is indexed up front,
+# so any block can be reached directly and decoded from a memoryview slice without further reads.
+
+CHUNK        = Struct('<4sI')
+MDL_HEAD     = Struct('<3ff2I')   # inertia multiplier, bounding radius, distance fades, has bounding box
+BOUNDINGBOX  = Struct('<3f3f3ff') # min, max, center, rotation y
+MDL_FLAGS    = Struct('<4I48x')   # unique materials, unique textures, generic geometry, vertex buffer flags
+COUNT        = Struct('<I')
+BITMAP       = Struct('<256s2I')  # path, type, index
+MATPROP_MDL2 = Struct('<4f4f4f4f2f2I8s')
+MATPROP_MDL1 = Struct('<I6f')
+MDL0_HEAD    = Struct('<4s3IfI')  # signature, ?, ?, ?, ?, bitmaps
+MDL0_GEOM    = Struct('<8If3I2H4I')
+DETAILLEVEL  = Struct('<IfI8x')   # type, max edge length, rendergroups
+RENDERGROUP  = Struct('<4H12x' '3H2B' + 'IH2B'*4 + '4i2I4H8x')
+FILL         = Struct('<3I')      # selectable primitive blocks, fill type, indices
+
+# RENDERGROUP field positions
+RG_POLYGONS, RG_VERTICES, RG_MATERIAL, RG_EFFECTS = range(4)
+RG_TEXBLEND = slice(4, 9)
+RG_BLENDS   = slice(9, 25)
+RG_VERTEX   = slice(25, 35)
+RG_VERTEX_SIZE, RG_VERTEX_COUNT = 29, 32
+
+VERTEX_HAS_VECTOR = 0b0001 # invariable
+VERTEX_HAS_NORMAL = 0b0010 # invariable
+VERTEX_HAS_COLOR  = 0b0100 # only set in a few models
+VERTEX_HAS_UV     = 0b1000 # invariable
+
+Chunk       = namedtuple('Chunk', 'name offset size') # offset is where the chunk's data starts, past its name and size
+DetailLevel = namedtuple('DetailLevel', 'offset type maxedgelength rendergroups')
+Rendergroup = namedtuple('Rendergroup', 'offset polygons vertex_offset vertex_count vertex_size fill_type index_offset index_count')
+
+def indexcount(fill_type, polygons):
+	return polygons * 3 if fill_type == 0 else polygons + 2
+
+def vertexdtype(
+	offset_vector  , # always 0
+	offset_normal  , # always 12
+	offset_colour  , # variable (trash memory if not flags & VERTEX_HAS_COLOR)
+	offset_texcoord, # variable on account of previous int
+	size_vertstruct, # variable on account of previous ints
+	num_texcoords  , # either 1, or 2 (rare)
+	flags          , # see VERTEX_HAS_VECTOR and its following flags
+	*args            # vertices, managed buffer, current vertex
+):
+	names, formats, offsets = ['vector', 'normal'], ['<3f4', '<3f4'], [offset_vector, offset_normal]
+	if flags & VERTEX_HAS_COLOR:
+		names += ['colour']; formats += ['<4f4']; offsets += [offset_colour]
+	if num_texcoords:
+		names += ['texcoord']; formats += [('<f4', (num_texcoords, 2))]; offsets += [offset_texcoord]
+	return np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': size_vertstruct})
+
+def swizzle(vectors): # file order is z, y, x
+	return vectors[:, ::-1]
+
+@timed('buildfaces')
+def buildfaces(fill_type, polygons, indices):
+	"""Triangles as an (n, 3) index array from a rendergroup's index block"""
+	if fill_type == 0:
+		faces = indices[:polygons * 3].reshape(-1, 3)
+	elif fill_type == 1:
+		faces = indices[np.arange(polygons)[:, None] + (0, 1, 2)]
+		faces[1::2] = faces[1::2, (1, 0, 2)] # every other triangle of a strip is wound the other way
+		faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])] # degenerates join strips
+	else:
+		raise AssertionError('Unsupported primitive fill type. (%i)' % fill_type)
+	count(indices = len(indices), faces = len(faces))
+	return faces
+
+class MD2Reader:
+	"""Memory-mapped .MD2 file with an offset index of its chunks, detail levels and rendergroups"""
+	def __init__(self, filepath):
+		self.filepath = filepath
+		with open(filepath, 'rb') as f:
+			self.size = fstat(f.fileno()).st_size
+			self.map  = mmap(f.fileno(), 0, access = ACCESS_READ) if self.size else b''
+		self.view         = memoryview(self.map)
+		self.signature    = bytes(self.view[:4])
+		self.chunks       = []
+		self.header       = None # offset of the MDL2/MDL1/MDL0 header fields
+		self.boundingbox  = None # offset of the bounding box, if the header has one
+		self.bitmaps      = []
+		self.matprops     = []
+		self.detaillevels = [] # (DetailLevel, [Rendergroup, ...])
+		if self.signature == b'MDL0': self.indexmdl0()
+		else: self.indexchunks()
+
+	def __enter__(self): return self
+	def __exit__(self, *args): self.close()
+
+	def close(self):
+		self.view.release()
+		if isinstance(self.map, mmap):
+			try: self.map.close()
+			except BufferError: pass # slices are still held by the caller, the map is freed along with them
+
+	def chunk(self, name):
+		for chunk in self.chunks:
+			if chunk.name == name: return chunk
+
+	def rendergroup(self, detaillevel_id, rendergroup_id):
+		return self.detaillevels[detaillevel_id][1][rendergroup_id]
+
+	def vertices(self, rendergroup):
+		return self.view[rendergroup.vertex_offset:rendergroup.vertex_offset + rendergroup.vertex_size * rendergroup.vertex_count]
+
+	def indices(self, rendergroup):
+		return self.view[rendergroup.index_offset:rendergroup.index_offset + rendergroup.index_count * 2]
+
+	def readvertices(self, rendergroup):
+		"""Structured array over the vertex block, without copying"""
+		dtype = vertexdtype(*self.readheader(rendergroup)[RG_VERTEX])
+		return np.frombuffer(self.vertices(rendergroup), dtype, rendergroup.vertex_count)
+
+	def readindices(self, rendergroup):
+		return np.frombuffer(self.indices(rendergroup), '<u2', rendergroup.index_count)
+
+	def readheader(self, rendergroup):
+		return RENDERGROUP.unpack_from(self.map, rendergroup.offset)
+
+	def readstring(self, offset, length):
+		end = self.map.find(b'\0', offset, offset + length)
+		return bytes(self.view[offset:end if end != -1 else offset + length])
+
+	def indexchunks(self):
+		offset = 0
+		while offset + 8 <= self.size:
+			chunk_name, chunk_size = CHUNK.unpack_from(self.map, offset)
+			if chunk_name == b'\0\0\0\0': break
+			chunk = Chunk(chunk_name, offset + 8, min(chunk_size, self.size - offset - 8))
+			self.chunks += [chunk]
+			if   chunk_name in (b'MDL2', b'MDL1'): self.indexheader(chunk)
+			elif chunk_name == b'GEO1'           : self.indexgeo1(chunk)
+			offset += 8 + chunk_size
+
+	def indexbitmaps(self, offset):
+		bitmap_count = COUNT.unpack_from(self.map, offset)[0]
+		offset += 4
+		for bitmap_id in range(bitmap_count):
+			bitmap_type, bitmap_index = BITMAP.unpack_from(self.map, offset)[1:]
+			self.bitmaps += [(self.readstring(offset, 256).decode('utf8'), bitmap_type, bitmap_index)]
+			offset += BITMAP.size
+		return offset
+
+	def indexheader(self, chunk):
+		offset = self.header = chunk.offset
+		hasboundingbox = MDL_HEAD.unpack_from(self.map, offset)[-1]
+		offset += MDL_HEAD.size
+		if hasboundingbox:
+			self.boundingbox = offset
+			offset += BOUNDINGBOX.size
+		offset = self.indexbitmaps(offset + MDL_FLAGS.size)
+		matprop_count = COUNT.unpack_from(self.map, offset)[0]
+		offset += 4
+		if chunk.name == b'MDL2':
+			for matprop_id in range(matprop_count):
+				matprop = MATPROP_MDL2.unpack_from(self.map, offset)
+				self.matprops += [(
+					matprop[0:4]  , # ambient
+					matprop[4:8]  , # diffuse
+					matprop[8:12] , # specular
+					matprop[12:16], # emissive
+					*matprop[16:20], # shine, alpha, alphatype, bitfield
+					self.readstring(offset + 80, 8), # animname
+				)]
+				offset += MATPROP_MDL2.size
+		else:
+			for matprop_id in range(matprop_count):
+				self.matprops += [MATPROP_MDL1.unpack_from(self.map, offset)]
+				offset += MATPROP_MDL1.size
+
+	def indexrendergroup(self, offset):
+		header = RENDERGROUP.unpack_from(self.map, offset)
+		vertex_offset = offset + RENDERGROUP.size
+		vertex_size   = header[RG_VERTEX_SIZE]
+		vertex_count  = header[RG_VERTEX_COUNT]
+		fill_offset   = vertex_offset + vertex_size * vertex_count
+		fill_type, fill_indices = FILL.unpack_from(self.map, fill_offset)[1:]
+		rendergroup = Rendergroup(
+			offset, header[RG_POLYGONS], vertex_offset, vertex_count, vertex_size,
+			fill_type, fill_offset + FILL.size, fill_indices,
+		)
+		return rendergroup, rendergroup.index_offset + fill_indices * 2
+
+	def indexgeo1(self, chunk):
+		offset = chunk.offset
+		detaillevels = COUNT.unpack_from(self.map, offset)[0]
+		offset += 4
+		for detaillevel_id in range(detaillevels):
+			detaillevel = DetailLevel(offset, *DETAILLEVEL.unpack_from(self.map, offset))
+			offset += DETAILLEVEL.size
+			rendergroups = []
+			for rendergroup_id in range(detaillevel.rendergroups):
+				rendergroup, offset = self.indexrendergroup(offset)
+				rendergroups += [rendergroup]
+			self.detaillevels += [(detaillevel, rendergroups)]
+
+	def indexmdl0(self): # no chunk system, a single mesh that is indexed as one detail level of one rendergroup
+		self.header = 0
+		bitmap_count = MDL0_HEAD.unpack_from(self.map, 0)[-1]
+		offset = MDL0_HEAD.size
+		for bitmap_id in range(bitmap_count):
+			self.bitmaps += [(self.readstring(offset, 256).decode('utf8'), 0, bitmap_id)]
+			offset += 256
+		offset += MDL0_GEOM.size - 20 # the polygon count onwards is laid out as a GEO1 rendergroup header
+		header = RENDERGROUP.unpack_from(self.map, offset)
+		polygons      = header[RG_POLYGONS]
+		vertex_offset = offset + RENDERGROUP.size
+		vertex_size   = header[RG_VERTEX_SIZE]
+		vertex_count  = header[RG_VERTEX_COUNT]
+		fill_offset   = vertex_offset + vertex_size * vertex_count
+		fill_type     = COUNT.unpack_from(self.map, fill_offset)[0]
+		rendergroup = Rendergroup(
+			offset, polygons, vertex_offset, vertex_count, vertex_size,
+			fill_type, fill_offset + 4, indexcount(fill_type, polygons),
+		)
+		self.detaillevels += [(DetailLevel(offset, 0, 0., 1), [rendergroup])]
\ No newline at end of file
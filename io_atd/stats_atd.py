@@ -0,0 +1,64 @@
+from os          import environ
+from time        import perf_counter
+from functools   import wraps
+from collections import OrderedDict
+import json
+
+# Per-stage timings and counters of the importer and exporter, free of bpy.
+# Off unless the ATD_STATS environment variable is set, or the addon preference turns it on; a value ending in .json
+# names a file the stages are dumped to. When off, an instrumented call costs one check, and nothing is counted per element.
+# Stages run in the worker processes of a multi-file import are not collected.
+
+ENABLED  = bool(environ.get('ATD_STATS'))
+JSONPATH = environ.get('ATD_STATS') if environ.get('ATD_STATS', '').lower().endswith('.json') else None
+STAGES   = OrderedDict() # name: {'calls': int, 'seconds': float, counter: int}
+ACTIVE   = [] # names of the stages being timed, innermost last
+
+def timed(name):
+	"""Decorator recording the calls and wall time of a function as a stage"""
+	def decorator(function):
+		@wraps(function)
+		def wrapper(*args, **kwargs):
+			if not ENABLED: return function(*args, **kwargs)
+			ACTIVE.append(name)
+			start = perf_counter()
+			try: return function(*args, **kwargs)
+			finally:
+				ACTIVE.pop()
+				stage = STAGES.setdefault(name, OrderedDict(calls = 0, seconds = 0.))
+				stage['calls']   += 1
+				stage['seconds'] += perf_counter() - start
+		return wrapper
+	return decorator
+
+def count(**counters):
+	"""Add to counters of the innermost stage being timed"""
+	if not ENABLED or not ACTIVE: return
+	stage = STAGES.setdefault(ACTIVE[-1], OrderedDict(calls = 0, seconds = 0.))
+	for counter, value in counters.items():
+		stage[counter] = stage.get(counter, 0) + value
+
+def reset():
+	STAGES.clear()
+
+def summary():
+	"""The stages as one table, with every counter that was recorded"""
+	counters = []
+	for stage in STAGES.values():
+		counters += [counter for counter in stage if counter not in counters and counter not in ('calls', 'seconds')]
+	width = max([len(name) for name in STAGES] + [5])
+	lines = [('%%-%is %%8s %%10s' % width) % ('stage', 'calls', 'seconds') + ''.join(' %12s' % counter for counter in counters)]
+	for name, stage in STAGES.items():
+		lines += [('%%-%is %%8i %%10.4f' % width) % (name, stage['calls'], stage['seconds']) + ''.join(' %12s' % stage.get(counter, '') for counter in counters)]
+	return '\n'.join(lines)
+
+def dump(filepath):
+	with open(filepath, 'w') as f:
+		json.dump(STAGES, f, indent = '\t')
+
+def report(jsonpath = None):
+	"""Print the summary, dump the stages to JSON if a file is given or set in the environment, and start over"""
+	if not ENABLED or not STAGES: return
+	print(summary())
+	if jsonpath or JSONPATH: dump(jsonpath or JSONPATH)
+	reset()
\ No newline at end of file
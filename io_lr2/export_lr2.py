@@ -1,5 +1,6 @@
 from struct import pack
 import bpy, bmesh
+import numpy as np
 from io import BytesIO as bio
 
 def write_lr2(filepath, **kwargs):
@@ -23,6 +24,61 @@ def write_lr2(filepath, **kwargs):
 #   Vector: (Center)
 #   Float : (Rotation Y)
 
+def uniquerows(keys):
+	"""First occurrence and inverse of each distinct row of a 2D array, numbered in order of first use"""
+	keys = np.ascontiguousarray(keys)
+	rows = keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+	unique, first, inverse = np.unique(rows, return_index = True, return_inverse = True)
+	order = np.argsort(first, kind = 'mergesort')
+	renumber = np.empty_like(order)
+	renumber[order] = np.arange(len(order))
+	return first[order], renumber[inverse.ravel()]
+
+def splitvertices(loop_vertex, loop_normal, loop_uv):
+	"""
+	One vertex per distinct (vertex, normal, uv) among the loops, so seams get a vertex for each side.
+	Returns the loop each new vertex is taken from, and the new vertex of every loop.
+	"""
+	keys = np.column_stack((
+		loop_vertex.astype(np.int32),
+		(loop_normal.astype(np.float32) + 0.).view(np.int32), # + 0. folds -0. into 0.
+		(loop_uv    .astype(np.float32) + 0.).view(np.int32),
+	))
+	return uniquerows(keys)
+
+def gatherrendergroup(rendergroup):
+	"""Positions, normals, uvs and triangles of a rendergroup, with vertices split along uv and normal seams"""
+	dl_mesh = bmesh.new()
+	dl_mesh.from_object(rendergroup, bpy.context.scene)
+	bmesh.ops.triangulate(dl_mesh, faces = dl_mesh.faces)
+	work_mesh = bpy.data.meshes.new(rendergroup.name)
+	dl_mesh.to_mesh(work_mesh)
+	dl_mesh.free()
+	work_mesh.use_auto_smooth   = rendergroup.data.use_auto_smooth # bmesh drops these, without which calc_normals_split ignores custom normals
+	work_mesh.auto_smooth_angle = rendergroup.data.auto_smooth_angle
+	try: uvlayer = work_mesh.uv_layers[0]
+	except IndexError: raise IndexError('Model does not have a UV map.')
+	work_mesh.calc_normals_split()
+	
+	loops = len(work_mesh.loops)
+	co          = np.empty(len(work_mesh.vertices) * 3, np.float32)
+	loop_vertex = np.empty(loops,     np.int32  )
+	loop_normal = np.empty(loops * 3, np.float32)
+	loop_uv     = np.empty(loops * 2, np.float32)
+	loop_start  = np.empty(len(work_mesh.polygons), np.int32)
+	work_mesh.vertices.foreach_get('co', co)
+	work_mesh.loops.foreach_get('vertex_index', loop_vertex)
+	work_mesh.loops.foreach_get('normal', loop_normal)
+	uvlayer.data.foreach_get('uv', loop_uv)
+	work_mesh.polygons.foreach_get('loop_start', loop_start)
+	bpy.data.meshes.remove(work_mesh)
+	
+	loop_normal = loop_normal.reshape(-1, 3)
+	loop_uv     = loop_uv.reshape(-1, 2)
+	vertex_loops, loop_split = splitvertices(loop_vertex, loop_normal, loop_uv)
+	faces = loop_split[loop_start[:, None] + np.arange(3)]
+	return co.reshape(-1, 3)[loop_vertex[vertex_loops]], loop_normal[vertex_loops], loop_uv[vertex_loops], faces
+
 def write_mdl2(filepath,
 	bounding_radius = 5,
 	distance_fades = True,
@@ -114,15 +170,11 @@ def write_mdl2(filepath,
 				)
 				
 				for rendergroup, bitmap_id in rendergroups:
-					dl_mesh = bmesh.new()
-					dl_mesh.from_object(rendergroup, bpy.context.scene)
-					dl_mesh.faces.ensure_lookup_table()
-					dl_mesh.verts.ensure_lookup_table()
-					dl_mesh.verts.index_update()
+					positions, normals, uvs, faces = gatherrendergroup(rendergroup)
 					
 					f.write(
-						pack('H', len(dl_mesh.faces))
-						+ pack('H', len(dl_mesh.verts))
+						pack('H', len(faces))
+						+ pack('H', len(positions))
 						+ pack('H', 1) # "material"
 						+ pack('H', 0) # "effects"
 						+ b'\0'*12
@@ -152,35 +204,19 @@ def write_mdl2(filepath,
 						+ pack('I', 32) #geo1_vertex_size_vertstruct,\
 						+ pack('I', 1) #geo1_vertex_num_texcoords  ,\
 						+ pack('H', 0b1011) #geo1_vertex_flags          ,\
-						+ pack('H', len(dl_mesh.verts)) #geo1_vertex_vertices       ,\
+						+ pack('H', len(positions)) #geo1_vertex_vertices       ,\
 						+ pack('H', 1) #geo1_vertex_managedbuffer  ,\
 						+ pack('H', 0) #geo1_vertex_currentvertex # looks unused, appears as a partially overwritten float in the official files
 						+ b'\0'*8
 					)
-					try: uvlayer = dl_mesh.loops.layers.uv[0]
-					except IndexError: raise IndexError('Model does not have a UV map.')
-					for vert in dl_mesh.verts:
-						uv = ()
-						for face in dl_mesh.faces:
-							for loop in face.loops:
-								if loop.vert.index == vert.index:
-									uv = loop[uvlayer].uv
-						assert uv, 'Did not find UV for vertex %i.' % vert
-						f.write(
-							pack('3f', *tuple(vert.co)[::-1])
-							+ pack('3f', *tuple(vert.normal)[::-1])
-							+ pack('2f', *uv)
-						)
+					f.write(np.hstack((positions[:, ::-1], normals[:, ::-1], uvs)).astype('<f4').tobytes())
 						
 					f.write(
 						pack('I', 1)
 						+ pack('I', 0)
-						+ pack('I', len(dl_mesh.faces)*3)
+						+ pack('I', faces.size)
 					)
-					for face in dl_mesh.faces:
-						f.write(
-							pack('3H', *(v.index for v in face.verts))
-						)
+					f.write(faces.astype('<u2').tobytes())
 				detaillevel_id += 1
 		chunkend = f.tell()
 		f.seek(chunkstart - 4)
@@ -3,6 +3,7 @@ from sys     import argv
 from os.path import split, splitext, join
 from io      import BytesIO as bio
 import bpy, bmesh
+import numpy as np
 
 def readnulltermstring(input,skip=False):
 	if type(input) in (str, bytes): #else it's a file object
@@ -27,23 +28,19 @@ def open_lr2(filepath, **kwargs):
 
 def buildfaces(work_bmesh, mdl0_fill_type, mdl0_polygons, f):
 	if mdl0_fill_type == 0:
-		for face in range(mdl0_polygons):
-			try:
-				work_bmesh.faces.new((work_bmesh.verts[x] for x in unpack('3H', f.read(6))))
-			except ValueError: # accounts for models of type double, but does not fix the problem
-				print('Face %i is two-sided, and this is unsupported.' % face)
+		faces = np.frombuffer(f.read(mdl0_polygons * 6), '<u2').reshape(-1, 3)
 	elif mdl0_fill_type == 1:
-		vertexbuffer = [*unpack('2H', f.read(4))]
-		for face in range(mdl0_polygons):
-			print(hex(f.tell()))
-			vertexbuffer += [*unpack('H', f.read(2))]
-			try:
-				work_bmesh.faces.new(work_bmesh.verts[v] for v in vertexbuffer)
-			except ValueError:
-				print('Face %i is two-sided, and this is unsupported.' % face)
-			del vertexbuffer[0]
+		indices = np.frombuffer(f.read((mdl0_polygons + 2) * 2), '<u2')
+		faces = indices[np.arange(mdl0_polygons)[:, None] + (0, 1, 2)]
+		faces[1::2] = faces[1::2, (1, 0, 2)] # every other triangle of a strip is wound the other way
+		faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])] # degenerates join strips
 	else:
 		raise AssertionError('Unsupported primitive fill type. (%i)' % mdl0_fill_type)
+	for face, vertices in enumerate(faces.tolist()):
+		try:
+			work_bmesh.faces.new(work_bmesh.verts[v] for v in vertices)
+		except ValueError: # accounts for models of type double, but does not fix the problem
+			print('Face %i is two-sided, and this is unsupported.' % face)
 	
 VERTEX_HAS_VECTOR = 0b0001 # invariable
 VERTEX_HAS_NORMAL = 0b0010 # invariable